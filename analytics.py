@@ -0,0 +1,249 @@
+"""Participation analytics over the transcript store, computed with NumPy.
+
+    python analytics.py --db transcripts.db --since-days 7 --output weekly.json
+
+load_corpus() reads messages in (session, id) order, a chunk at a time, into
+columnar arrays:
+- the session index, and the speaker and routing rule as integer codes;
+- the turn, message length, latency and tokens.
+
+Speakers are coded in roster order (Teacher, the students.json names, You).
+Routing rules are the decisions custom_speaker_selection recorded for each
+turn. Every statistic is then an array operation over the whole corpus:
+- bincount over codes;
+- masks;
+- comparisons between each row and the one before it, which give
+  speaker-to-speaker transitions within a session.
+None of it loops per message, so weekly reports over 100k sessions are
+dominated by reading the database.
+"""
+import argparse
+import json
+import sqlite3
+import time
+
+import numpy as np
+
+from routing import (
+    RULE_STRUCTURED, RULE_STRUCTURED_INVALID, RULE_MENTION, RULE_CALLOUT, RULE_FALLBACK, RULE_OPENING,
+)
+
+TEACHER = "Teacher"
+HUMAN = "You"
+RULES = [RULE_STRUCTURED, RULE_STRUCTURED_INVALID, RULE_MENTION, RULE_CALLOUT, RULE_FALLBACK, RULE_OPENING]
+
+# The Teacher's closing line, as matched by CONCLUSION_PATTERN in discussion.py
+# (LIKE is case-insensitive for ASCII).
+CONCLUSION_LIKE = "%see you next time%"
+
+CHUNK_ROWS = 100_000
+
+
+def roster(path="students.json"):
+    """Agent names in the order used for matrix rows and columns."""
+    with open(path, "r") as f:
+        return [TEACHER] + [student["name"] for student in json.load(f)] + [HUMAN]
+
+
+def _codes(values, labels):
+    """Integer codes of values in labels (extended with unseen values), -1 for empty strings."""
+    uniques, inverse = np.unique(values, return_inverse=True)
+    for value in uniques:
+        if value and value not in labels:
+            labels.append(value)
+    lookup = np.array([labels.index(value) if value else -1 for value in uniques], dtype=np.int32)
+    return lookup[inverse.reshape(-1)]
+
+
+class Corpus:
+    """Messages of many sessions as parallel arrays, ordered by session then message."""
+
+    def __init__(self, session_ids, session, speaker, rule, length, latency_ms, prompt_tokens,
+                 completion_tokens, concluded, agents, rules):
+        self.session_ids = session_ids
+        self.session = session
+        self.speaker = speaker
+        self.rule = rule
+        self.length = length
+        self.latency_ms = latency_ms
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.concluded = concluded
+        self.agents = agents
+        self.rules = rules
+
+    def __len__(self):
+        return len(self.session)
+
+    @property
+    def n_sessions(self):
+        return len(self.session_ids)
+
+    @property
+    def opening(self):
+        """True for the first message of each session."""
+        first = np.ones(len(self), dtype=bool)
+        first[1:] = self.session[1:] != self.session[:-1]
+        return first
+
+
+def load_corpus(path, since=None, until=None, agents=None):
+    """Load the messages stored between since and until (timestamps) from a transcript database."""
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    window = (since or 0, until or time.time())
+    try:
+        cursor = db.execute(
+            "SELECT session_id, agent, COALESCE(routing_rule, ''), LENGTH(content), latency_ms, "
+            "prompt_tokens, completion_tokens FROM messages WHERE ts >= ? AND ts < ? "
+            "ORDER BY session_id, id", window)
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(CHUNK_ROWS)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=object))
+        concluded_ids = [row[0] for row in db.execute(
+            "SELECT DISTINCT session_id FROM messages WHERE agent = ? AND content LIKE ? AND ts >= ? AND ts < ?",
+            (TEACHER, CONCLUSION_LIKE, *window))]
+    finally:
+        db.close()
+
+    rows = np.concatenate(chunks) if chunks else np.empty((0, 7), dtype=object)
+    sids = rows[:, 0].astype(str)
+    change = np.ones(len(sids), dtype=bool)
+    change[1:] = sids[1:] != sids[:-1]
+    session = np.cumsum(change, dtype=np.int64) - 1
+    session_ids = sids[change]
+
+    agents = list(agents or roster())
+    rules = list(RULES)
+    return Corpus(
+        session_ids=session_ids,
+        session=session,
+        speaker=_codes(rows[:, 1].astype(str), agents),
+        rule=_codes(rows[:, 2].astype(str), rules),
+        length=rows[:, 3].astype(np.float64),
+        latency_ms=rows[:, 4].astype(np.float64),
+        prompt_tokens=np.nan_to_num(rows[:, 5].astype(np.float64)),
+        completion_tokens=np.nan_to_num(rows[:, 6].astype(np.float64)),
+        concluded=np.isin(session_ids, np.array(concluded_ids, dtype=str)),
+        agents=agents,
+        rules=rules,
+    )
+
+
+def transition_matrix(corpus):
+    """counts[i, j]: how often agents[j] spoke directly after agents[i] in the same session."""
+    n = len(corpus.agents)
+    same = ~corpus.opening[1:]
+    pairs = corpus.speaker[:-1][same] * n + corpus.speaker[1:][same]
+    return np.bincount(pairs, minlength=n * n).reshape(n, n)
+
+
+def talk_share(corpus):
+    """Share of turns and of characters spoken by each agent, excluding each session's opening prompt."""
+    spoken = ~corpus.opening
+    n = len(corpus.agents)
+    turns = np.bincount(corpus.speaker[spoken], minlength=n)
+    chars = np.bincount(corpus.speaker[spoken], weights=corpus.length[spoken], minlength=n)
+    return turns / max(turns.sum(), 1), chars / max(chars.sum(), 1)
+
+
+def human_calls(corpus):
+    """How often the human participant was given the turn; never, when the roster has no human."""
+    if HUMAN in corpus.agents:
+        called = (corpus.speaker == corpus.agents.index(HUMAN)) & ~corpus.opening
+    else:
+        called = np.zeros_like(corpus.opening)
+    per_session = np.bincount(corpus.session[called], minlength=corpus.n_sessions)
+    spoken = max(int((~corpus.opening).sum()), 1)
+    return {
+        "total": int(called.sum()),
+        "share_of_turns": round(float(called.sum()) / spoken, 4),
+        "per_session_mean": round(float(per_session.mean()), 2) if corpus.n_sessions else 0.0,
+        "sessions_never_called": round(float((per_session == 0).mean()), 4) if corpus.n_sessions else 0.0,
+    }
+
+
+def routing_rates(corpus):
+    """Share of routed turns decided by each rule, and the fallback rate by the speaker who failed to call on anyone.
+
+    The Teacher's answer to the opening prompt is not routed. Transcripts written before RULE_OPENING
+    tagged it as a fallback, so the turn straight after each opening prompt is left out as well.
+    """
+    answers_opening = np.zeros(len(corpus), dtype=bool)
+    answers_opening[1:] = corpus.opening[:-1] & (corpus.session[1:] == corpus.session[:-1])
+    routed = (corpus.rule >= 0) & (corpus.rule != corpus.rules.index(RULE_OPENING)) & ~answers_opening
+    by_rule = np.bincount(corpus.rule[routed], minlength=len(corpus.rules))
+    fallback = routed & (corpus.rule == corpus.rules.index(RULE_FALLBACK))
+
+    n = len(corpus.agents)
+    previous = np.empty_like(corpus.speaker)
+    previous[1:] = corpus.speaker[:-1]
+    after = routed & ~corpus.opening
+    attempts = np.bincount(previous[after], minlength=n)
+    misses = np.bincount(previous[after & fallback], minlength=n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        by_speaker = np.where(attempts > 0, misses / attempts, np.nan)
+    return {
+        "routed_turns": int(routed.sum()),
+        "fallback_rate": round(float(fallback.sum()) / max(int(routed.sum()), 1), 4),
+        "by_rule": {rule: int(count) for rule, count in zip(corpus.rules, by_rule) if rule != RULE_OPENING},
+        "fallback_rate_by_previous_speaker": {
+            agent: round(float(rate), 4) for agent, rate in zip(corpus.agents, by_speaker) if not np.isnan(rate)
+        },
+    }
+
+
+def turns_to_conclusion(corpus):
+    """Turns taken (after the opening prompt) in sessions the Teacher closed."""
+    turns = np.bincount(corpus.session, minlength=corpus.n_sessions) - 1
+    closed = turns[corpus.concluded]
+    if not len(closed):
+        return {"concluded_sessions": 0, "conclusion_rate": 0.0}
+    p50, p90 = np.percentile(closed, [50, 90])
+    return {
+        "concluded_sessions": int(len(closed)),
+        "conclusion_rate": round(len(closed) / corpus.n_sessions, 4),
+        "mean": round(float(closed.mean()), 2),
+        "median": float(p50),
+        "p90": float(p90),
+        "max": int(closed.max()),
+    }
+
+
+def report(corpus):
+    turn_share, char_share = talk_share(corpus)
+    return {
+        "sessions": int(corpus.n_sessions),
+        "messages": len(corpus),
+        "agents": corpus.agents,
+        "transitions": transition_matrix(corpus).tolist(),
+        "talk_share": {
+            agent: {"turns": round(float(t), 4), "characters": round(float(c), 4)}
+            for agent, t, c in zip(corpus.agents, turn_share, char_share)
+        },
+        "human_calls": human_calls(corpus),
+        "routing": routing_rates(corpus),
+        "turns_to_conclusion": turns_to_conclusion(corpus),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Participation report over stored discussions")
+    parser.add_argument("--db", required=True, help="transcript database (TRANSCRIPT_PATH)")
+    parser.add_argument("--since-days", type=float, help="only sessions from the last N days")
+    parser.add_argument("--students", default="students.json", help="roster that fixes the agent order")
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    since = time.time() - args.since_days * 86400 if args.since_days else None
+    result = json.dumps(report(load_corpus(args.db, since=since, agents=roster(args.students))), indent=2)
+    print(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(result + "\n")
+
+
+if __name__ == "__main__":
+    main()
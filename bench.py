@@ -0,0 +1,383 @@
+"""Benchmarks for speaker routing, session startup, framing and throughput.
+
+    python bench.py                          # run everything, print JSON
+    python bench.py --output results.json --baseline bench_baseline.json
+    python bench.py --save-baseline bench_baseline.json
+
+The end-to-end benchmarks start mock_llm.py on a free port and run the
+discussion server in-process against it, so no network or API key is
+needed. A fake human answers whenever an agent calls on "You". The mock
+server's output and the discussion server's log go to --log. A run that
+never receives an agent message counts as a failure, and the exit status is
+then 1. With --baseline, every metric is compared against the saved run and
+the exit status is 1 when one is worse by more than --tolerance.
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import serve
+from websockets.exceptions import WebSocketException
+
+from client_frames import HUMAN_REPLY, frame_text, is_human_turn
+from log_config import configure_logging, io_log, log, stop_logging
+from routing import parse_structured_reply
+from sessions import Session
+from warm_pool import WarmPool
+from ws_stream import ResumableStream
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_mock_llm(port, log_file=subprocess.DEVNULL):
+    """Launch mock_llm.py and point discussion.py at it through CONFIG_LIST_PATH."""
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_llm.py"),
+         "--port", str(port), "--latency", "fixed:0", "--seed", "7"],
+        stdout=log_file, stderr=subprocess.STDOUT,
+    )
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    else:
+        process.kill()
+        raise RuntimeError("mock_llm.py did not start")
+
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "CONFIG_LIST.mock.json"), "r") as f:
+        entries = [{**entry, "base_url": f"http://127.0.0.1:{port}/v1"} for entry in json.load(f)]
+    config = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+    json.dump(entries, config)
+    config.close()
+    os.environ["CONFIG_LIST_PATH"] = config.name
+    return process
+
+
+def timed(fn, number):
+    """Per-call latency statistics, in microseconds, over `number` calls."""
+    samples = []
+    for _ in range(number):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {
+        "mean": statistics.fmean(samples),
+        "p50": samples[len(samples) // 2],
+        "p95": samples[int(0.95 * (len(samples) - 1))],
+    }
+
+
+def message_corpus(names, size, seed=1):
+    """Realistic classroom messages: call-outs, passing mentions, no names and structured replies."""
+    rng = random.Random(seed)
+    sentences = [
+        "Metamorphosis lets the larva and the adult use completely different resources.",
+        "I think bulk flow is faster than diffusion over long distances because it moves the whole fluid.",
+        "That connects to what we said about surface area to volume ratios earlier.",
+        "I'm not sure that's right, since diffusion still matters at the cellular level.",
+        "Let's think about how pressure gradients drive the flow in the aorta.",
+    ]
+    callouts = ["{n}, what do you think?", "What do you think, {n}?", "I'd love to hear from {n}.",
+                "{n}, could you add to that?", "Let's hear from {n} next."]
+    corpus = []
+    for _ in range(size):
+        body = " ".join(rng.choice(sentences) for _ in range(rng.randint(1, 6)))
+        kind = rng.random()
+        if kind < 0.55:
+            text = f"{body} {rng.choice(callouts).format(n=rng.choice(names))}"
+        elif kind < 0.75:
+            text = f"As {rng.choice(names)} said, {body.lower()}"
+        elif kind < 0.9:
+            text = body
+        else:
+            text = json.dumps({"reply": body, "next_speaker": rng.choice(names)})
+        corpus.append(text)
+    return corpus
+
+
+class FakeChat:
+    def __init__(self, agents):
+        self.agents = agents
+        self.messages = []
+
+
+class FakeAgent:
+    def __init__(self, name):
+        self.name = name
+
+
+def bench_routing(discussion, number):
+    names = [p.name for p in discussion.persona_store.students] + ["Teacher", "You"]
+    corpus = message_corpus(names, 2000)
+    chat = FakeChat([FakeAgent(name) for name in names])
+    cursor = itertools.count()
+
+    def find():
+        discussion.find_next_speaker(corpus[next(cursor) % len(corpus)], names)
+
+    def select():
+        content = corpus[next(cursor) % len(corpus)]
+        chat.messages = [{"content": content, "name": "Alvin", "sender": "Alvin", "role": "user"}]
+        discussion.custom_speaker_selection(chat.agents[0], chat)
+
+    return {"find_next_speaker": timed(find, number), "custom_speaker_selection": timed(select, number)}
+
+
+def bench_framing(discussion, number):
+    text = message_corpus(["Alvin"], 1)[0] * 4
+    structured = {"reply": text, "next_speaker": "Alvin"}
+    return {
+        "agent_message_frame_text": timed(lambda: discussion.agent_message_frame("Alvin", text), number),
+        "agent_message_frame_dict": timed(lambda: discussion.agent_message_frame("Alvin", structured), number),
+    }
+
+
+def bench_logging(number):
+    """Cost on the calling thread of a per-message record that INFO filters out, and of one that is queued."""
+    content = message_corpus(["Alvin"], 1)[0] * 4
+    return {
+        "log_debug_at_info": timed(lambda: io_log.debug(
+            "Sent message from %s: %.100s", "Alvin", content, extra={"event": "send"}), number),
+        "log_info_queued": timed(lambda: log.info("Opened session %s", "bench"), number),
+    }
+
+
+def bench_build(discussion, number):
+    """Agent construction for one session, and whether persona prompts stay fixed."""
+    expected = {p.name: p.system_message for p in discussion.persona_store.by_name.values()}
+    constant = True
+    loop = asyncio.new_event_loop()
+
+    def build():
+        nonlocal constant
+        stream = ResumableStream(loop=loop)
+        session = Session(stream)
+        discussion.build_classroom(stream, session)
+        for agent in session.agents:
+            if agent.name in expected and agent.system_message != expected[agent.name]:
+                constant = False
+
+    try:
+        stats = timed(build, number)
+    finally:
+        loop.close()
+    return stats, constant
+
+
+async def run_discussion(url, until_first=False, timeout=300):
+    """Drive one discussion as the human; returns (seconds to first agent message, total seconds, turns).
+
+    With until_first the connection is closed as soon as the first agent message arrives. The first
+    value is None when no agent message arrived before the connection closed or timed out.
+    """
+    start = time.perf_counter()
+    first = None
+    turns = 0
+    previous = None
+
+    async def drive():
+        nonlocal first, turns, previous
+        async with connect(url, max_size=None) as ws:
+            await ws.send(json.dumps({"type": "command", "content": "start"}))
+            async for raw in ws:
+                try:
+                    frame = json.loads(raw)
+                except json.JSONDecodeError:
+                    continue
+                if is_human_turn(frame):
+                    await ws.send(json.dumps({"type": "user_message", "content": HUMAN_REPLY}))
+                    continue
+                text = frame_text(frame)
+                if not text:
+                    continue
+                text, _ = parse_structured_reply(text)
+                if text == previous:
+                    continue
+                previous = text
+                turns += 1
+                if first is None:
+                    first = time.perf_counter() - start
+                    if until_first:
+                        return
+
+    try:
+        await asyncio.wait_for(drive(), timeout)
+    except (asyncio.TimeoutError, OSError, WebSocketException) as e:
+        log.warning("Benchmark discussion ended early: %r", e)
+    return first, time.perf_counter() - start, turns
+
+
+def mean_ms(seconds):
+    return 1000 * statistics.fmean(seconds) if seconds else None
+
+
+async def bench_end_to_end(discussion, startups, discussions, concurrency):
+    port = free_port()
+    url = f"ws://127.0.0.1:{port}"
+    await discussion.start_session_services()
+    results = {}
+    failures = {}
+    async with serve(discussion.on_connect, "127.0.0.1", port, max_size=None):
+        discussion.warm_pool = None
+        cold = [(await run_discussion(url, until_first=True))[0] for _ in range(startups)]
+        failures["cold_start"] = cold.count(None)
+        results["cold_start_first_message_ms"] = mean_ms([first for first in cold if first is not None])
+
+        discussion.warm_pool = WarmPool(startups, 900, discussion.prepare_warm_session)
+        await discussion.warm_pool.start()
+        while discussion.warm_pool.snapshot()["ready"] < startups:
+            await asyncio.sleep(0.05)
+        warm = [(await run_discussion(url, until_first=True))[0] for _ in range(startups)]
+        failures["warm_start"] = warm.count(None)
+        results["warm_start_first_message_ms"] = mean_ms([first for first in warm if first is not None])
+        await discussion.warm_pool.stop()
+        discussion.warm_pool = None
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                return await run_discussion(url)
+
+        start = time.perf_counter()
+        runs = await asyncio.gather(*(one() for _ in range(discussions)))
+        elapsed = time.perf_counter() - start
+        completed = [run for run in runs if run[0] is not None]
+        failures["discussion"] = len(runs) - len(completed)
+        results["discussions_per_second"] = len(completed) / elapsed
+        results["turns_per_second"] = sum(turns for _, _, turns in completed) / elapsed
+        results["discussion_seconds_mean"] = statistics.fmean(total for _, total, _ in completed) if completed else None
+    return results, failures
+
+
+def metric(value, unit, better="lower"):
+    return {"value": round(value, 3), "unit": unit, "better": better}
+
+
+def compare(metrics, baseline, tolerance):
+    report = {}
+    for name, current in metrics.items():
+        previous = baseline.get("metrics", {}).get(name)
+        if not previous or not previous["value"]:
+            continue
+        change = (current["value"] - previous["value"]) / previous["value"]
+        worse = change > tolerance if current["better"] == "lower" else change < -tolerance
+        report[name] = {"baseline": previous["value"], "change_pct": round(100 * change, 1), "regressed": worse}
+    return report
+
+
+def run_benchmarks(args, log_file):
+    import discussion
+    # Routing and framing are measured with logging on at INFO, as served, writing to --log.
+    configure_logging(level="INFO", levels={}, sample={}, fmt="text", stream=log_file)
+
+    metrics = {}
+    for name, stats in bench_routing(discussion, args.number).items():
+        metrics[f"{name}_mean_us"] = metric(stats["mean"], "us")
+        metrics[f"{name}_p95_us"] = metric(stats["p95"], "us")
+    for name, stats in bench_framing(discussion, args.number).items():
+        metrics[f"{name}_mean_us"] = metric(stats["mean"], "us")
+    for name, stats in bench_logging(args.number).items():
+        metrics[f"{name}_mean_us"] = metric(stats["mean"], "us")
+    build, prompts_constant = bench_build(discussion, args.builds)
+    metrics["build_classroom_mean_ms"] = metric(build["mean"] / 1000, "ms")
+    metrics["persona_prompt_chars"] = metric(discussion.persona_store.prompt_chars(), "chars")
+
+    failures = {}
+    if not args.skip_e2e:
+        e2e, failures = asyncio.run(bench_end_to_end(discussion, args.startups, args.discussions, args.concurrency))
+        units = {
+            "cold_start_first_message_ms": ("ms", "lower"),
+            "warm_start_first_message_ms": ("ms", "lower"),
+            "discussions_per_second": ("1/s", "higher"),
+            "turns_per_second": ("1/s", "higher"),
+            "discussion_seconds_mean": ("s", "lower"),
+        }
+        for name, (unit, better) in units.items():
+            if e2e[name] is not None:
+                metrics[name] = metric(e2e[name], unit, better)
+    return metrics, prompts_constant, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classroom benchmarks")
+    parser.add_argument("--number", type=int, default=5000, help="calls per microbenchmark")
+    parser.add_argument("--builds", type=int, default=50, help="sessions built for the construction benchmark")
+    parser.add_argument("--startups", type=int, default=5, help="cold and warm starts to average")
+    parser.add_argument("--discussions", type=int, default=20, help="full discussions for throughput")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--skip-e2e", action="store_true", help="only run the in-process microbenchmarks")
+    parser.add_argument("--output", help="write results JSON here as well as to stdout")
+    parser.add_argument("--baseline", help="compare against this saved results file")
+    parser.add_argument("--save-baseline", help="save these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    parser.add_argument("--log", default=os.path.join(tempfile.gettempdir(), "classroom_bench.log"),
+                        help="mock server output and discussion server log")
+    args = parser.parse_args()
+
+    log_file = open(args.log, "w")
+    mock = None
+    if not args.skip_e2e:
+        mock = start_mock_llm(free_port(), log_file)
+    elif not os.getenv("CONFIG_LIST_PATH"):
+        os.environ["CONFIG_LIST_PATH"] = "CONFIG_LIST.mock.json"
+    os.environ.pop("LLM_CACHE_PATH", None)
+    os.environ["WARM_POOL_SIZE"] = "0"
+    os.environ["WORKERS"] = "0"
+
+    try:
+        # AG2 prints agent activity to stdout; keep it out of the results JSON.
+        with contextlib.redirect_stdout(log_file):
+            metrics, prompts_constant, failures = run_benchmarks(args, log_file)
+    finally:
+        if mock:
+            mock.terminate()
+            mock.wait()
+        stop_logging()
+        log_file.close()
+
+    results = {
+        "meta": {"timestamp": time.time(), "python": sys.version.split()[0], "args": vars(args)},
+        "checks": {"persona_prompts_constant": prompts_constant, "failed_runs": failures},
+        "metrics": metrics,
+    }
+    failed = not prompts_constant or any(failures.values())
+    if any(failures.values()):
+        with open(args.log, "r") as f:
+            tail = f.readlines()[-20:]
+        print(f"{sum(failures.values())} benchmark discussion(s) got no agent message; "
+              f"last lines of {args.log}:\n" + "".join(tail), file=sys.stderr)
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            results["comparison"] = compare(metrics, json.load(f), args.tolerance)
+        failed = failed or any(entry["regressed"] for entry in results["comparison"].values())
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w") as f:
+            f.write(output + "\n")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""Helpers for scripted clients of the discussion WebSocket server.
+
+bench.py and loadgen.py both play the human in a discussion; this module holds
+what they share: the reply they send, how they tell it is their turn and how
+they read agent messages out of server frames.
+
+A message can reach the client more than once, e.g. as the final streamed
+frame and again as AG2's text event, so clients skip a text equal to the one
+just before it. Distinct turns may repeat earlier wording and are kept.
+"""
+
+HUMAN_REPLY = "I think it depends on the pressure difference, but I'm not sure."
+
+# The server's system message when speaker selection picks the human.
+HUMAN_TURN_NOTICE = "It's You's turn to speak."
+
+
+def is_human_turn(frame):
+    """True for the server's notice that the human has the floor."""
+    return frame.get("type") == "system_message" and frame.get("content") == HUMAN_TURN_NOTICE
+
+
+def frame_text(frame):
+    """Complete agent message text in a server frame, or None."""
+    if frame.get("type") == "agent_message" and (frame.get("final") or "id" not in frame):
+        return frame.get("content")
+    if frame.get("type") == "text" and isinstance(frame.get("content"), dict):
+        content = frame["content"]
+        if (content.get("sender") or content.get("sender_name")) not in (None, "You"):
+            return content.get("content")
+    return None
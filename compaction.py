@@ -0,0 +1,220 @@
+"""Rolling-summary compaction of an agent's conversation history.
+
+RollingSummary is a transform for AG2's TransformMessages capability. It
+keeps the last `keep_last` messages verbatim and folds everything older into
+a single summary message. By default the summary is extractive: one line per
+folded message, giving the speaker and their first sentence, kept
+incrementally so each turn only processes newly folded messages. When a
+`summarizer` is given, usually one backed by a cheaper model, the extractive
+lines are periodically condensed by it on a background thread, so the event
+loop never waits on the summary. A per-agent token ceiling is then enforced
+by trimming the summary first and the oldest verbatim messages last.
+Message token counts are kept alongside the history the same way, so each
+turn only tokenizes messages it has not seen before.
+
+Tokens are counted with tiktoken, which downloads its encodings on first
+use. Where that is impossible (offline, or a model tiktoken does not know),
+counts fall back to an estimate of four characters per token.
+"""
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from autogen import OpenAIWrapper
+from autogen.agentchat.contrib.capabilities.transform_messages import TransformMessages
+from autogen.token_count_utils import count_token
+
+from log_config import log
+from routing import SENTENCE_SPLIT, parse_structured_reply
+
+SUMMARY_HEADER = "Summary of the discussion so far:\n"
+LINE_CHARS = 240
+
+# Prompt tokens per agent turn before and after compaction, for /status.
+compaction_stats = Counter()
+_stats_lock = threading.Lock()
+
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="compaction")
+
+
+def _content(message):
+    content = message.get("content", "") if isinstance(message, dict) else message
+    if not isinstance(content, str):
+        return ""
+    text, _ = parse_structured_reply(content)
+    return text or ""
+
+
+def extract_line(message):
+    """One-line extractive summary of a message: speaker and first sentence."""
+    text = " ".join(_content(message).split())
+    first = SENTENCE_SPLIT.split(text, maxsplit=1)[0] if text else ""
+    if len(first) > LINE_CHARS:
+        first = first[:LINE_CHARS].rstrip() + "…"
+    speaker = (message.get("name") or message.get("role", "")) if isinstance(message, dict) else ""
+    return f"- {speaker}: {first}" if speaker else f"- {first}"
+
+
+def llm_summarizer(llm_config, max_words=200):
+    """Summarizer that condenses text with the model(s) in llm_config."""
+    client = OpenAIWrapper(**llm_config)
+
+    def summarize(previous, lines):
+        prompt = (
+            f"Condense this classroom discussion into at most {max_words} words. Keep who said what, "
+            "open questions and misconceptions that were raised.\n\n"
+            f"{previous}\n" + "\n".join(lines)
+        )
+        response = client.create(messages=[{"role": "user", "content": prompt}], cache=None)
+        return client.extract_text_or_completion_object(response)[0] or previous
+
+    return summarize
+
+
+# Models whose tokens are estimated because tiktoken could not load an encoding for them.
+_estimated_models = set()
+
+
+def text_tokens(text, model):
+    if model not in _estimated_models:
+        try:
+            return count_token(text, model)
+        except Exception as e:
+            _estimated_models.add(model)
+            log.warning("No tokenizer for %s (%s); estimating tokens from length", model, e)
+    return len(text) // 4 + 1
+
+
+def one_message_tokens(message, model):
+    return text_tokens(_content(message), model) + 4
+
+
+def message_tokens(messages, model):
+    return sum(one_message_tokens(m, model) for m in messages)
+
+
+def _record(before, after, compacted):
+    with _stats_lock:
+        compaction_stats["turns"] += 1
+        compaction_stats["compacted_turns"] += compacted
+        compaction_stats["tokens_before"] += before
+        compaction_stats["tokens_after"] += after
+
+
+def compaction_snapshot():
+    with _stats_lock:
+        stats = dict(compaction_stats)
+    turns = stats.get("turns", 0)
+    return {
+        "turns": turns,
+        "compacted_turns": stats.get("compacted_turns", 0),
+        "avg_prompt_tokens_before": round(stats.get("tokens_before", 0) / turns, 1) if turns else 0,
+        "avg_prompt_tokens_after": round(stats.get("tokens_after", 0) / turns, 1) if turns else 0,
+    }
+
+
+class RollingSummary:
+    """Keep recent turns verbatim and replace older ones with a summary."""
+
+    def __init__(self, keep_last=8, max_tokens=None, summarizer=None, summarize_every=6, model="gpt-4o"):
+        self.keep_last = max(keep_last, 1)
+        self.max_tokens = max_tokens
+        self.summarizer = summarizer
+        self.summarize_every = summarize_every
+        self.model = model
+        self._lines = []
+        self._summary = ""
+        self._summarized = 0
+        self._pending = False
+        self._tokens = []
+        self._last_counts = None
+        self._lock = threading.Lock()
+
+    def _reset(self):
+        self._lines = []
+        self._summary = ""
+        self._summarized = 0
+
+    def _message_counts(self, messages):
+        # Called with the lock held: token counts for messages, tokenizing only new ones.
+        if len(messages) < len(self._tokens):
+            self._tokens = []
+        self._tokens.extend(one_message_tokens(m, self.model) for m in messages[len(self._tokens):])
+        return list(self._tokens)
+
+    def _condense(self, previous, lines, upto):
+        try:
+            summary = self.summarizer(previous, lines)
+        except Exception:
+            summary = None
+        with self._lock:
+            self._pending = False
+            if summary and upto <= len(self._lines):
+                self._summary = summary
+                self._summarized = upto
+
+    def _summary_text(self):
+        # Called with the lock held.
+        if (self.summarizer and not self._pending
+                and len(self._lines) - self._summarized >= self.summarize_every):
+            self._pending = True
+            upto = len(self._lines)
+            _summary_executor.submit(self._condense, self._summary, self._lines[self._summarized:upto], upto)
+        return self._summary, self._lines[self._summarized:]
+
+    def apply_transform(self, messages):
+        with self._lock:
+            counts = self._message_counts(messages)
+        before = sum(counts)
+
+        if len(messages) <= self.keep_last and (self.max_tokens is None or before <= self.max_tokens):
+            self._last_counts = (before, before)
+            _record(before, before, 0)
+            return messages
+
+        older, recent = messages[:-self.keep_last], list(messages[-self.keep_last:])
+        recent_counts = counts[-self.keep_last:]
+        with self._lock:
+            if len(older) < len(self._lines):
+                self._reset()
+            self._lines.extend(extract_line(m) for m in older[len(self._lines):])
+            summary, lines = self._summary_text()
+
+        def render():
+            if not summary and not lines:
+                return []
+            body = "\n".join(filter(None, [summary, *lines]))
+            return [{"role": "system", "content": SUMMARY_HEADER + body}]
+
+        header = render()
+        after = message_tokens(header, self.model) + sum(recent_counts)
+        if self.max_tokens is not None:
+            while after > self.max_tokens:
+                if lines:
+                    lines = lines[1:]
+                elif summary:
+                    summary = ""
+                elif len(recent) > 1:
+                    recent.pop(0)
+                    recent_counts = recent_counts[1:]
+                else:
+                    break
+                header = render()
+                after = message_tokens(header, self.model) + sum(recent_counts)
+
+        self._last_counts = (before, after)
+        _record(before, after, 1)
+        return header + recent
+
+    def get_logs(self, pre_transform_messages, post_transform_messages):
+        # apply_transform has just counted both sides; recounting would tokenize the whole history again.
+        before, after = self._last_counts or (
+            message_tokens(pre_transform_messages, self.model), message_tokens(post_transform_messages, self.model))
+        if after < before:
+            return f"Compacted history from {before} to {after} tokens.", True
+        return "No compaction needed.", False
+
+
+def add_compaction(agent, **kwargs):
+    """Attach a RollingSummary to an agent through AG2's TransformMessages."""
+    TransformMessages(transforms=[RollingSummary(**kwargs)]).add_to_agent(agent)
@@ -0,0 +1,208 @@
+"""Per-turn deadlines and hedged LLM requests.
+
+HedgedDeadline is a middleware (see llm_calls.py) that runs each completion
+on a helper thread. If the call is still pending after the agent's recent p95
+latency, a duplicate is sent to the next config_list entry, or to the same
+one when there is only one, and whichever answers first is used. If neither
+answers within the turn deadline, TurnDeadlineExceeded is raised and the
+late calls are left to finish in the background. Their output goes through
+a GatedStream that is shut once the call has lost, so it never reaches the
+client; hedged duplicates are never streamed.
+
+Install the hedger outside the rate limiter and usage tracker, and its route
+middleware innermost:
+
+    install_middleware(agent, ..., hedger, rate_limiter.for_session(id), usage_tracker, hedger.route)
+
+Hedged duplicates then pass back through call_next, so they take a permit and
+are counted like any other call; route sends them to the hedge client.
+
+guard_turn() makes an agent answer a missed deadline with a short fallback
+reply that hands the floor on, so the discussion continues.
+"""
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from autogen import ConversableAgent, OpenAIWrapper
+from autogen.io.base import IOStream
+
+# Params key carrying a hedged duplicate's client from the hedger to its route middleware.
+HEDGE_CLIENT = "hedge_client"
+
+# Hedge delay used until an agent has enough latency samples for a p95.
+MIN_SAMPLES = 20
+
+FALLBACK_REPLIES = {
+    "Teacher": "Let's pause on that thought for a moment. You, what do you think so far?",
+    None: "I need a moment to think that through. Teacher, could you go on?",
+}
+
+
+class TurnDeadlineExceeded(TimeoutError):
+    """No completion arrived within the turn deadline."""
+
+
+class GatedStream:
+    """IOStream that forwards to target until shut."""
+
+    def __init__(self, target):
+        self.target = target
+        self.open = True
+
+    def send(self, message):
+        if self.open:
+            self.target.send(message)
+
+    def print(self, *objects, sep=" ", end="\n", flush=False):
+        if self.open:
+            self.target.print(*objects, sep=sep, end=end, flush=flush)
+
+    def input(self, prompt="", *, password=False):
+        return self.target.input(prompt, password=password)
+
+    async def a_input(self):
+        return await self.target.a_input()
+
+
+class LatencyWindow:
+    """Recent successful call latencies for one agent."""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self):
+        with self._lock:
+            if len(self._samples) < MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+class HedgedDeadline:
+    """Middleware bounding every completion by a deadline, with optional hedging."""
+
+    def __init__(self, deadline=None, hedge=True, default_hedge_delay=8.0, min_hedge_delay=1.0, max_workers=64):
+        self.deadline = deadline
+        self.hedge = hedge
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.deadline_misses = 0
+        self._latency = {}
+        self._hedge_clients = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _window(self, name):
+        with self._lock:
+            return self._latency.setdefault(name, LatencyWindow())
+
+    def hedge_delay(self, name):
+        p95 = self._window(name).p95()
+        return self.default_hedge_delay if p95 is None else max(p95, self.min_hedge_delay)
+
+    def _hedge_client(self, agent):
+        llm_config = agent.llm_config
+        config_list = llm_config["config_list"]
+        entry = config_list[1] if len(config_list) > 1 else config_list[0]
+        if not isinstance(entry, dict):
+            entry = entry.model_dump(mode="json", exclude_none=True)
+        # An entry's own "stream" wins over the call's, so turn it off on the entry.
+        config = {**llm_config, "config_list": [{**entry, "stream": False}]}
+        key = json.dumps(config, sort_keys=True, default=str)
+        with self._lock:
+            if key not in self._hedge_clients:
+                self._hedge_clients[key] = OpenAIWrapper(**config)
+            return self._hedge_clients[key]
+
+    def route(self, call_next, agent, params):
+        """Innermost middleware: send a hedged duplicate to its hedge client."""
+        client = params.get(HEDGE_CLIENT)
+        if client is None:
+            return call_next(params)
+        return client.create(**{key: value for key, value in params.items() if key != HEDGE_CLIENT})
+
+    def _submit(self, call, params, gate):
+        def run():
+            with IOStream.set_default(gate):
+                return call(params)
+        return self._executor.submit(run)
+
+    def __call__(self, call_next, agent, params):
+        if not self.deadline and not self.hedge:
+            return call_next(params)
+
+        start = time.monotonic()
+        deadline = start + self.deadline if self.deadline else None
+        primary_gate = GatedStream(IOStream.get_default())
+        pending = {self._submit(call_next, params, primary_gate): primary_gate}
+        hedge_at = start + self.hedge_delay(agent.name) if self.hedge else None
+
+        while pending:
+            wake = min(t for t in (deadline, hedge_at) if t is not None) if (deadline or hedge_at) else None
+            timeout = None if wake is None else max(wake - time.monotonic(), 0)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                gate = pending.pop(future)
+                if future.exception() is None:
+                    for loser in pending.values():
+                        loser.open = False
+                    if gate is not primary_gate:
+                        self._count("hedge_wins")
+                    self._window(agent.name).add(time.monotonic() - start)
+                    return future.result()
+                if not pending:
+                    raise future.exception()
+
+            now = time.monotonic()
+            if hedge_at is not None and now >= hedge_at:
+                hedge_at = None
+                self._count("hedged")
+                hedged_params = {**params, "stream": False, HEDGE_CLIENT: self._hedge_client(agent)}
+                silent = GatedStream(primary_gate.target)
+                silent.open = False
+                pending[self._submit(call_next, hedged_params, silent)] = silent
+            if deadline is not None and now >= deadline:
+                for gate in pending.values():
+                    gate.open = False
+                self._count("deadline_misses")
+                raise TurnDeadlineExceeded(f"{agent.name} did not answer within {self.deadline:g}s")
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "deadline_seconds": self.deadline,
+                "hedging": self.hedge,
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+                "deadline_misses": self.deadline_misses,
+            }
+
+
+def guard_turn(agent, on_timeout=None):
+    """Answer a missed turn deadline with a fallback reply instead of failing the chat."""
+    fallback = FALLBACK_REPLIES.get(agent.name, FALLBACK_REPLIES[None])
+
+    async def generate_reply(recipient, messages=None, sender=None, config=None):
+        try:
+            return await ConversableAgent.a_generate_oai_reply(recipient, messages, sender, config)
+        except TurnDeadlineExceeded as e:
+            if on_timeout:
+                on_timeout(recipient, e)
+            return True, fallback
+
+    agent.replace_reply_func(ConversableAgent.a_generate_oai_reply, generate_reply)
@@ -6,17 +6,21 @@ from autogen import UserProxyAgent, GroupChat, GroupChatManager, ConversableAgen
 from autogen.io.websockets import IOWebsockets
 from dotenv import load_dotenv
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 import uvicorn
 from contextlib import asynccontextmanager
+from sessions import SessionRegistry
+from llm_calls import install_middleware, count_calls, refuse_calls, usage_tracker, call_counts
+import metrics
+from log_config import configure_logging, log, io_log
 
 quiet_mode = "--quiet" in sys.argv or "-q" in sys.argv
 
-def console_log(message):
-    if not quiet_mode:
-        print(message)
-
 load_dotenv()
+configure_logging(level="WARNING" if quiet_mode else None)
+
+def console_log(message):
+    log.info(message)
 api_key = os.getenv("OPENAI_API_KEY")
 
 if not api_key:
@@ -24,7 +28,12 @@ if not api_key:
 
 PORT = 9999
 
-discussion_active = False
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "20"))
+
+# Round-robin selection never needs the model; make the manager fail loudly if it tries.
+MANAGER_OFFLINE = os.getenv("MANAGER_OFFLINE", "1").lower() in ("1", "true", "yes")
+
+sessions = SessionRegistry(MAX_SESSIONS)
 
 try:
     config_path = "CONFIG_LIST.json"
@@ -51,8 +60,6 @@ except Exception as e:
 
 def on_connect(iostream: IOWebsockets) -> None:
     """Handle new WebSocket connection and start classroom discussion."""
-    global discussion_active
-
     console_log(f"[WebSocket] New client connected: {iostream}")
 
     try:
@@ -65,7 +72,6 @@ def on_connect(iostream: IOWebsockets) -> None:
                 if isinstance(parsed_initial, dict) and parsed_initial.get("type") == "command":
                     if parsed_initial.get("content") == "restart_discussion":
                         console_log("Restart command received - treating as new discussion")
-                        discussion_active = False
                         initial_msg = "start_discussion"
         except json.JSONDecodeError:
             pass
@@ -73,19 +79,18 @@ def on_connect(iostream: IOWebsockets) -> None:
         console_log(f"Error receiving initial message: {e}")
         return
 
-    if discussion_active:
-        console_log("A discussion is already active")
+    session = sessions.open(iostream)
+    if session is None:
+        console_log(f"All {MAX_SESSIONS} classrooms are in use")
         try:
             iostream.send(json.dumps({
                 "type": "system_message",
-                "content": "A discussion is already in progress."
+                "content": "All classrooms are currently busy. Please try again shortly."
             }))
         except Exception as e:
             console_log(f"Error sending busy message: {e}")
         return
 
-    discussion_active = True
-
     try:
         teacher = ConversableAgent(
             name="Teacher",
@@ -113,11 +118,12 @@ def on_connect(iostream: IOWebsockets) -> None:
 
         def custom_input(prompt=None):
             """Handle user input via WebSocket, ensuring structured JSON messages."""
-            console_log(f"User's turn to respond: {prompt}")
+            io_log.debug("User's turn to respond: %s", prompt, extra={"event": "input"})
+            session.state = "waiting_for_input"
 
             if prompt:
                 try:
-                    console_log("Waiting for user input via WebSocket...")
+                    io_log.debug("Waiting for user input via WebSocket", extra={"event": "input"})
                 except Exception as e:
                     console_log(f"Error in custom_input: {e}")
 
@@ -135,10 +141,11 @@ def on_connect(iostream: IOWebsockets) -> None:
                             parsed_message = raw_message
 
                         if parsed_message.get("type") == "ping":
-                            console_log("Ping received, keeping connection alive")
+                            io_log.debug("Ping received, keeping connection alive", extra={"event": "ping"})
                             continue
 
                         if parsed_message.get("type") == "user_message":
+                            session.state = "running"
                             return parsed_message["content"]
                         elif parsed_message.get("type") == "terminate":
                             console_log("Exit command received. Terminating discussion.")
@@ -159,6 +166,7 @@ def on_connect(iostream: IOWebsockets) -> None:
                     return "exit"
 
         user_proxy.get_human_input = custom_input
+        session.agents = [teacher, user_proxy]
 
         group_chat = GroupChat(
             agents=[teacher, user_proxy],
@@ -167,18 +175,23 @@ def on_connect(iostream: IOWebsockets) -> None:
             speaker_selection_method="round_robin",
             allow_repeat_speaker=True
         )
+        session.group_chat = group_chat
 
         chat_manager = GroupChatManager(
             groupchat=group_chat,
             name="chat_manager",
             llm_config=llm_config,
         )
+        counter = count_calls(session.llm_calls)
+        install_middleware(teacher, counter, usage_tracker)
+        install_middleware(chat_manager, counter, *([refuse_calls] if MANAGER_OFFLINE else []))
 
         if initial_msg.lower() == "start_discussion":
             start_msg = """Start a classroom discussion about an interesting scientific topic that would engage students. Begin by introducing the topic and asking an open-ended question. Keep the discussion engaging and educational."""
         else:
             start_msg = initial_msg
 
+        session.state = "running"
         user_proxy.initiate_chat(
             chat_manager,
             message=start_msg
@@ -195,8 +208,9 @@ def on_connect(iostream: IOWebsockets) -> None:
             console_log(f"WebSocket send error in on_connect: {ws_error}")
 
     finally:
-        discussion_active = False
-        console_log("Classroom discussion has concluded.")
+        session.state = "concluded"
+        sessions.close(session.id)
+        console_log(f"[Session {session.id}] Classroom discussion has concluded.")
 
 html = """
 
@@ -595,7 +609,7 @@ html = """
 
                         if (message.type === "text" && message.content) {
                             const parsedContent = safeJsonParse(message.content.content);
-                            addAgentMessage(message.content.sender_name, parsedContent.content || message.content.content);
+                            addAgentMessage(message.content.sender || message.content.sender_name, parsedContent.content || message.content.content);
                         }
                         else if (message.type === "user_message") {
                             addAgentMessage("You", message.content);
@@ -846,12 +860,26 @@ async def get():
     """Serve the HTML interface."""
     return HTMLResponse(html)
 
+metrics.REGISTRY.gauge("classroom_sessions_active", "Discussions currently running in this process.").set_function(
+    lambda: len(sessions))
+metrics.REGISTRY.counter("classroom_sessions_rejected_total", "Connections turned away at capacity.").set_function(
+    lambda: sessions.rejected)
+metrics.REGISTRY.counter("classroom_llm_call_attempts_total", "LLM completions requested, by caller, including cache hits.", ["caller"]).set_function(
+    lambda: dict(call_counts))
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics for this process."""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/status")
 async def status():
     """Return server status."""
     return {
         "status": "running",
-        "discussion_active": discussion_active
+        "discussion_active": len(sessions) > 0,
+        "max_sessions": MAX_SESSIONS,
+        "sessions": sessions.snapshot()
     }
 
 if __name__ == "__main__":
@@ -2,34 +2,134 @@ import sys
 import os
 import json
 import re
+import asyncio
+import time
+import secrets
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
 import autogen
 from autogen import UserProxyAgent, GroupChat, GroupChatManager, ConversableAgent
-from autogen.io.websockets import IOWebsockets
+from autogen.io.base import IOStream
+from websockets.asyncio.server import serve
 from dotenv import load_dotenv
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 from contextlib import asynccontextmanager
-import logging
+from log_config import configure_logging, log, routing_log, io_log, llm_log
+from sessions import SessionRegistry, Session
+from personas import PersonaStore, agent_kwargs
+from ws_stream import WebSocketStream, ResumableStream
+from streaming import DeltaStream
+from warm_pool import WarmPool, WarmSession
+from sharding import WorkerPool
+from llm_cache import cache_from_env, attach_cache
+from model_tiers import agent_llm_config
+from llm_calls import (
+    install_middleware, usage_tracker, count_calls, count_tokens, refuse_calls, require_agent_selection,
+    call_counts,
+)
+from llm_pool import RateLimiter, pooled_agent
+from deadlines import HedgedDeadline, guard_turn
+from tracing import Tracer, llm_span_middleware
+from transcripts import store_from_env, attach_transcript
+import metrics
+from compaction import add_compaction, llm_summarizer, compaction_snapshot
+from routing import (
+    get_router, routing_stats, parse_structured_reply, structured_reply_schema,
+    STRUCTURED_REPLY_INSTRUCTIONS, RULE_STRUCTURED, RULE_STRUCTURED_INVALID, RULE_FALLBACK, RULE_OPENING,
+)
 
-logging.basicConfig(level=logging.INFO)
+load_dotenv()
+configure_logging()
 
 def console_log(message):
-    logging.info(message)
-
-load_dotenv()
+    """Log a session lifecycle message; per-message logging goes to the subsystem loggers."""
+    log.info(message)
 api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    console_log("CRITICAL: OpenAI API Key is missing. Cannot start application.")
-    sys.exit(1)
 
 PORT = 9999
 
-discussion_active = False
+# When enabled, agents reply with {"reply": ..., "next_speaker": ...} and the
+# declared speaker is used directly; regex routing is only a fallback.
+STRUCTURED_ROUTING = os.getenv("STRUCTURED_ROUTING", "").lower() in ("1", "true", "yes")
+
+# Stream replies to the client token by token as agent_message_delta frames.
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "1").lower() in ("1", "true", "yes")
+
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "20"))
+# Connections beyond MAX_SESSIONS wait in a queue this deep; the rest are turned away.
+SESSION_QUEUE_DEPTH = int(os.getenv("SESSION_QUEUE_DEPTH", "50"))
+QUEUE_UPDATE_SECONDS = float(os.getenv("QUEUE_UPDATE_SECONDS", "5"))
+
+# Sessions share one event loop; threads are only used for in-flight LLM calls.
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "64"))
+
+# Process-wide LLM admission: requests and tokens per minute (0 = unlimited)
+# and the most calls in flight, which is halved on every 429.
+LLM_RPM = int(os.getenv("LLM_RPM", "0"))
+LLM_TPM = int(os.getenv("LLM_TPM", "0"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", str(LLM_WORKERS)))
+
+# A turn with no completion after TURN_DEADLINE_SECONDS (0 disables) gets a
+# fallback reply. With HEDGE_REQUESTS, a slow call is duplicated after the
+# agent's p95 latency (HEDGE_DELAY_SECONDS until enough calls have been seen).
+TURN_DEADLINE_SECONDS = float(os.getenv("TURN_DEADLINE_SECONDS", "60"))
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "").lower() in ("1", "true", "yes")
+HEDGE_DELAY_SECONDS = float(os.getenv("HEDGE_DELAY_SECONDS", "8"))
+
+# With WORKERS > 0 this process only proxies sessions to that many worker
+# processes, each serving discussions on WORKER_BASE_PORT + index.
+WORKERS = int(os.getenv("WORKERS", "0"))
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", "8100"))
+WORKER_MAX_SESSIONS = int(os.getenv("WORKER_MAX_SESSIONS", "0"))
+
+# Sessions kept ready with the Teacher's opener already generated (0 disables).
+WARM_POOL_SIZE = int(os.getenv("WARM_POOL_SIZE", "0"))
+WARM_POOL_TTL = float(os.getenv("WARM_POOL_TTL", "900"))
+
+# A dropped client can reconnect within RESUME_GRACE_SECONDS and resume its
+# discussion, replaying up to RESUME_BUFFER_FRAMES missed frames.
+RESUME_GRACE_SECONDS = float(os.getenv("RESUME_GRACE_SECONDS", "120"))
+RESUME_BUFFER_FRAMES = int(os.getenv("RESUME_BUFFER_FRAMES", "5000"))
+
+# Speaker selection never needs the model; with MANAGER_OFFLINE the manager
+# raises instead of silently making an LLM call.
+MANAGER_OFFLINE = os.getenv("MANAGER_OFFLINE", "1").lower() in ("1", "true", "yes")
+
+# Per-session span trees for finding where a slow turn spent its time, read
+# from /debug/traces and appended to TRACE_FILE (JSONL) when set.
+TRACING = os.getenv("TRACING", "").lower() in ("1", "true", "yes")
+TRACE_BUFFER_SPANS = int(os.getenv("TRACE_BUFFER_SPANS", "10000"))
+tracer = Tracer(TRACING, TRACE_BUFFER_SPANS, os.getenv("TRACE_FILE") or None)
+
+# Every message is appended to an SQLite transcript store when TRANSCRIPT_PATH is set.
+transcripts = store_from_env()
+
+# Completions are cached on disk when LLM_CACHE_PATH is set (see llm_cache.py).
+llm_cache = cache_from_env()
+
+# Agents see the last COMPACTION_KEEP_LAST messages verbatim and a rolling
+# summary of the rest (0 disables). COMPACTION_MAX_TOKENS caps each agent's
+# history; COMPACTION_MODEL condenses the summary with a cheaper model.
+COMPACTION_KEEP_LAST = int(os.getenv("COMPACTION_KEEP_LAST", "8"))
+COMPACTION_MAX_TOKENS = int(os.getenv("COMPACTION_MAX_TOKENS", "0")) or None
+COMPACTION_MODEL = os.getenv("COMPACTION_MODEL", "")
+
+worker_pool = WorkerPool(WORKERS, WORKER_BASE_PORT, max_sessions_per_worker=WORKER_MAX_SESSIONS,
+                         sticky_ttl=RESUME_GRACE_SECONDS) if WORKERS > 0 else None
+
+sessions = SessionRegistry(MAX_SESSIONS, SESSION_QUEUE_DEPTH)
+
+rate_limiter = RateLimiter(LLM_RPM, LLM_TPM, LLM_MAX_CONCURRENCY)
+hedger = HedgedDeadline(TURN_DEADLINE_SECONDS or None, HEDGE_REQUESTS, HEDGE_DELAY_SECONDS, max_workers=LLM_WORKERS)
 
 try:
-    config_path = "CONFIG_LIST.json"
+    # CONFIG_LIST_PATH=CONFIG_LIST.mock.json runs against mock_llm.py with no API key.
+    config_path = os.getenv("CONFIG_LIST_PATH", "CONFIG_LIST.json")
     config_list = autogen.config_list_from_json(config_path)
 
     for config in config_list:
@@ -51,6 +151,21 @@ except Exception as e:
         ]
     }
 
+if any(not config.get("api_key") for config in llm_config["config_list"]):
+    console_log("CRITICAL: OpenAI API Key is missing. Cannot start application.")
+    sys.exit(1)
+
+summarizer = None
+if COMPACTION_KEEP_LAST and COMPACTION_MODEL:
+    summarizer = llm_summarizer({
+        "config_list": agent_llm_config(llm_config, "summarizer", {"model": COMPACTION_MODEL})["config_list"]
+    })
+
+if STREAM_REPLIES:
+    # "stream" is a per-entry option; LLMConfig rejects it at the top level. An entry
+    # can opt out with "stream": false, as CONFIG_LIST.mock.json does.
+    llm_config["config_list"] = [{"stream": True, **config} for config in llm_config["config_list"]]
+
 try:
     with open("students.json", "r") as f:
         student_data = json.load(f)
@@ -81,66 +196,30 @@ except Exception as e:
         }
     ]
 
+CONCLUSION_PATTERN = re.compile(r"\bsee you next time\b", re.IGNORECASE)
+
 def find_next_speaker(last_message_content, agent_names):
+    return route_next_speaker(last_message_content, agent_names)[0]
+
+def route_next_speaker(last_message_content, agent_names):
+    """Return the speaker a message calls on and the routing rule that decided it."""
     if not last_message_content:
-        return None
+        return None, RULE_FALLBACK
 
     last_message_content = last_message_content.strip()
-    console_log(f"🔍 Analyzing message to find next speaker: {last_message_content[:100]}...")
-
-    sentences = re.split(r'[.!?]\s+', last_message_content)
-    sentences = [s.strip() for s in sentences if s.strip()]
-
-    valid_agents = {"You", "Teacher"} | set(agent_names)
-
-    if sentences:
-        last_two_sentences = sentences[-2:] if len(sentences) >= 2 else sentences
-        for sentence in last_two_sentences:
-            for name in valid_agents:
-                pattern = r'\b{}\b'.format(re.escape(name))
-                if re.search(pattern, sentence):
-                    console_log(f"🎯 Found direct call-out to: {name}")
-                    return name
-
-    agent_regex = r"({})".format("|".join(re.escape(name) for name in valid_agents))
-
-    patterns = [
-        rf"(?:^|\W){agent_regex}(?:,|\.|\?|!|\s).*?\?$",
-        rf"(?:^|\W){agent_regex}(?:,|\.|\?|!|\s).*thoughts",
-        rf"(?:^|\W){agent_regex}(?:,|\.|\?|!|\s).*think",
-        rf"Let's hear from\s+{agent_regex}",
-        rf"{agent_regex},\s+would you",
-        rf"What (?:do|about|are) (?:you|your).*,\s+{agent_regex}",
-        rf"{agent_regex},\s+what",
-        rf"What do you think,?\s+{agent_regex}",
-        rf"Do you (?:have|think).*,?\s+{agent_regex}",
-        rf"How about you,?\s+{agent_regex}",
-        rf"{agent_regex},\s+(?:do|can|could) you",
-        rf"(?:Do|Can|Could|Would) {agent_regex}",
-        rf"I'd like to hear from\s+{agent_regex}",
-        rf"{agent_regex}\s+(?:should|could|would) (?:you|your)",
-        rf"hear (?:your|) thoughts,?\s+{agent_regex}",
-        rf"ask\s+{agent_regex}",
-    ]
+    routing_log.debug("Analyzing message to find next speaker: %.100s", last_message_content, extra={"event": "route"})
 
-    for pattern in patterns:
-        matches = re.findall(pattern, last_message_content, re.IGNORECASE)
-        if matches:
-            for match in matches:
-                if isinstance(match, tuple):
-                    match = match[0]
-                if match in valid_agents:
-                    console_log(f"🎯 Found direct call-out to: {match}")
-                    return match
+    router = get_router({"You", "Teacher"} | set(agent_names))
+    next_speaker, rule = router.route(last_message_content)
+    routing_stats[rule] += 1
+    if next_speaker:
+        routing_log.debug("Found call-out to %s", next_speaker, extra={"event": "route", "rule": rule})
+        return next_speaker, rule
 
-    if "Teacher" in valid_agents:
-        console_log("⚠️ No valid student was explicitly called. Defaulting to 'Teacher'.")
-        return "Teacher"
+    routing_log.debug("No valid student was explicitly called; defaulting to Teacher", extra={"event": "route", "rule": rule})
+    return "Teacher", rule
 
-    console_log("⚠️ No valid participant found. Defaulting to 'You'.")
-    return "You"
-
-def custom_speaker_selection(last_speaker, group_chat, iostream=None):
+def custom_speaker_selection(last_speaker, group_chat, iostream=None, session=None):
     agent_names = [agent.name for agent in group_chat.agents]
 
     last_message = group_chat.messages[-1] if group_chat.messages else None
@@ -148,7 +227,8 @@ def custom_speaker_selection(last_speaker, group_chat, iostream=None):
         return next(agent for agent in group_chat.agents if agent.name == "Teacher")
 
     last_speaker_name = last_message.get("sender", "")
-    last_content = last_message.get("content", "").strip()
+    last_content, declared_speaker = parse_structured_reply(last_message.get("content", ""))
+    last_content = last_content.strip()
 
     if last_speaker_name == "Teacher" and "See you next time!" in last_content:
         if iostream:
@@ -158,10 +238,10 @@ def custom_speaker_selection(last_speaker, group_chat, iostream=None):
                     "content": "The discussion has concluded. See you next time!"
                 }))
             except Exception as e:
-                console_log(f"🚨 Error sending system message: {e}")
+                io_log.warning("Error sending system message: %s", e)
         return None
 
-    if re.search(r"\bsee you next time\b", last_content, re.IGNORECASE):
+    if CONCLUSION_PATTERN.search(last_content):
         if iostream:
             try:
                 iostream.send(json.dumps({
@@ -169,16 +249,32 @@ def custom_speaker_selection(last_speaker, group_chat, iostream=None):
                     "content": "The discussion is concluding. Thank you all!"
                 }))
             except Exception as e:
-                console_log(f"🚨 Error sending system message: {e}")
+                io_log.warning("Error sending system message: %s", e)
         return None
 
-    next_speaker = find_next_speaker(last_content, agent_names)
+    if len(group_chat.messages) == 1:
+        routing_stats[RULE_OPENING] += 1
+        next_speaker, rule = "Teacher", RULE_OPENING
+    elif declared_speaker in agent_names and declared_speaker != last_message.get("name"):
+        routing_stats[RULE_STRUCTURED] += 1
+        next_speaker, rule = declared_speaker, RULE_STRUCTURED
+    else:
+        if declared_speaker:
+            routing_stats[RULE_STRUCTURED_INVALID] += 1
+        next_speaker, rule = route_next_speaker(last_content, agent_names)
+
     if next_speaker is None or next_speaker not in agent_names:
         next_speaker = "Teacher"
 
     if next_speaker and next_speaker in agent_names:
         next_agent = next(agent for agent in group_chat.agents if agent.name == next_speaker)
 
+        if session:
+            session.turns += 1
+            session.current_speaker = next_speaker
+            session.route_rule = rule
+        metrics.turns.inc()
+
         if iostream:
             try:
                 iostream.send(json.dumps({
@@ -186,307 +282,523 @@ def custom_speaker_selection(last_speaker, group_chat, iostream=None):
                     "content": f"It's {next_speaker}'s turn to speak."
                 }))
             except Exception as e:
-                console_log(f"🚨 Error sending next speaker notification: {e}")
+                io_log.warning("Error sending next speaker notification: %s", e)
 
         return next_agent
 
     return next(agent for agent in group_chat.agents if agent.name == "Teacher")
 
-discussion_active = False
+def agent_reply_config(candidates, role, entry):
+    """Return (extra system message, llm_config) for an agent that may call on candidates."""
+    config = agent_llm_config(llm_config, role, entry)
+    if not STRUCTURED_ROUTING:
+        return "", config
+    return (
+        STRUCTURED_REPLY_INSTRUCTIONS.format(names=", ".join(candidates)),
+        {**config, "response_format": structured_reply_schema(candidates)},
+    )
+
+TEACHER_PROMPT = """You are a knowledgeable teacher leading a classroom discussion.
+
+        📜 RULES FOR CALLING ON PARTICIPANTS:
+        - You MUST always call on a specific participant at the end of each message.
+        - Choose ONLY from this list of students: {students}, or "You" (the human user).
+        - NEVER invent names. If unsure, call on "You" (the human user).
+
+        If you call on an invalid name, the conversation will not progress. Follow these rules strictly.
+
+        🚀 YOUR RESPONSIBILITIES:
+        - Ask thought-provoking questions.
+        - Call on specific students or the human user by name to participate.
+        - Guide the discussion and ensure everyone gets a turn.
+        - Address misconceptions and encourage deeper thinking.
+        - Summarize key points at appropriate moments.
+        - **End discussions gracefully and efficiently without unnecessary repetition.**
+
+        🔥 ALWAYS end your message with a direct call-out:
+        - "[name], what do you think?"
+        - "[name], do you have an example?"
+        - "You, what's your take on this?"
+
+        ❌ Do NOT ask 'anyone' in general.
+        ❌ Do NOT call on non-existent students.
+        ❌ Do NOT end without calling on someone.
+
+        If you do not follow these instructions, the discussion will stall. Stick to the given names.
+
+        📜 RULES FOR ENDING THE DISCUSSION:
+        Always invite "You" (the human user) to share final thoughts before concluding.
+
+        Example: "You, before we wrap up, do you have any final takeaways from today's discussion?"
+        If "You" does not respond or has nothing to add, provide a single final summary and conclude the session.
+
+        DO NOT call on students once the discussion is ending.
+
+        If students have already shared their thoughts, there is no need to ask them again.
+        Wrap up with a clear and warm closing message.
+
+        Example: "Thank you all for the great discussion! Keep thinking critically, and I look forward to our next session!"
+        Optionally, pose a reflective question for students to think about before the next session.
+
+        🛑 FINAL MESSAGE STRUCTURE
+        Once "You" has spoken (or opted out), DO NOT ask more questions. Instead, wrap up with:
+
+        A thank you to participants.
+        A brief summary of key discussion points.
+        An optional reflection question for students to consider.
+        A clear conclusion without starting a new discussion.
+
+        Example Final Message:
+        "Thank you all for today's discussion! We explored X, Y, and Z. Keep thinking critically about these ideas.
+        As a final thought, how might you apply these concepts in real life? See you next time!"
+
+        🚨 DO NOT start a new discussion after concluding. Your closing message MUST include "See you next time!"
+        """
+
+STUDENT_GUIDELINES = """
+        **📜 IMPORTANT GUIDELINES FOR PARTICIPATION**
+
+        1. **Always end your messages by calling on a specific classmate, the teacher, or "You" (the human user).**
+        - **You may only call on:** {classmates}, "Teacher," or "You."  
+        - **DO NOT call on yourself.** If unsure, call on "Teacher."
+
+        👀 Examples:
+        - *"What do you think about this, [classmate's name]?"*
+        - *"[classmate's name], have you considered this perspective?"*
+        - *"Teacher, what's your perspective on this?"*
+        - *"You, have you experienced something similar?"*
+
+        2. **Make your call-out direct and specific.**
+        - Phrase it as a question that invites a response.
+
+        3. **DO NOT end with vague questions.**
+        - ❌ *"What does everyone think?"*
+        - ❌ *"Any thoughts?"*
+
+        4. **Always speak in the first person.**
+        - You are **{name}**, so **always refer to yourself as "I"**, not in the third person.
+
+        5. **DO NOT answer questions directed at others.**
+        - If another participant is called on, **wait for them to respond.**
+        - 🛑 DO NOT send messages like *"WAITING FOR XYZ TO RESPOND."*
+        - **Simply stay silent until it is your turn.**
+        """
+
+persona_store = PersonaStore.build(
+    student_data,
+    teacher_prompt=TEACHER_PROMPT,
+    teacher_description="A teacher facilitating the classroom discussion",
+    student_guidelines=STUDENT_GUIDELINES,
+    reply_config=agent_reply_config,
+    max_context_tokens=COMPACTION_MAX_TOKENS,
+)
 
-def on_connect(iostream: IOWebsockets) -> None:
-    """Handle new WebSocket connection and start classroom discussion."""
-    global discussion_active
+def agent_message_frame(agent_name, content):
+    """JSON frame carrying one complete agent message to the client."""
+    if isinstance(content, dict):
+        content_str = json.dumps(content)
+    elif not isinstance(content, str):
+        content_str = str(content)
+    else:
+        content_str = content
+
+    return json.dumps({
+        "type": "agent_message",
+        "agent": agent_name,
+        "content": content_str
+    })
+
+def build_classroom(iostream, session):
+    """Create the agents, GroupChat and manager for one session."""
+    if STREAM_REPLIES:
+        iostream = DeltaStream(iostream, session)
+        session.iostream = iostream
+
+    teacher = pooled_agent(ConversableAgent, **agent_kwargs(persona_store.teacher))
+
+    student_agents = [pooled_agent(ConversableAgent, **agent_kwargs(persona)) for persona in persona_store.students]
+
+    def finish_streamed_reply(sender, message, recipient, silent):
+        """Close the delta stream of a reply with one complete agent_message frame."""
+        message_id = iostream.finish()
+        if message_id:
+            content = message.get("content", "") if isinstance(message, dict) else message
+            content, _ = parse_structured_reply(content)
+            try:
+                with tracer.span("websocket_send", session.id, session.turn_span, agent=sender.name, streamed=True):
+                    iostream.send(json.dumps({
+                        "type": "agent_message",
+                        "id": message_id,
+                        "agent": sender.name,
+                        "content": content,
+                        "final": True
+                    }))
+            except Exception as e:
+                io_log.warning("Error sending final message frame: %s", e, extra={"session": session.id})
+        return message
+
+    if STREAM_REPLIES:
+        for agent in [teacher] + student_agents:
+            agent.register_hook("process_message_before_send", finish_streamed_reply)
+
+    if COMPACTION_KEEP_LAST:
+        for agent in [teacher] + student_agents:
+            add_compaction(
+                agent,
+                keep_last=COMPACTION_KEEP_LAST,
+                max_tokens=persona_store.by_name[agent.name].max_context_tokens,
+                summarizer=summarizer,
+            )
 
-    console_log(f"[WebSocket] New client connected: {iostream}")
+    user_proxy = UserProxyAgent(
+        name="You",
+        human_input_mode="ALWAYS",
+        system_message="You are participating in a classroom discussion. Share your thoughts when called upon.",
+        description="The human user participating in the discussion",
+        code_execution_config=False,
+        is_termination_msg=lambda x: isinstance(x, str) and x.lower().strip() == "exit" or
+            (isinstance(x, dict) and x.get("content", "").lower().strip() == "exit"),
+    )
 
-    try:
-        initial_msg = iostream.input()
-        console_log(f"Initial message from client: {initial_msg}")
+    all_participants = [teacher] + student_agents + [user_proxy]
+    session.agents = all_participants
 
-        try:
-            if isinstance(initial_msg, str):
-                parsed_initial = json.loads(initial_msg)
-                if isinstance(parsed_initial, dict) and parsed_initial.get("type") == "command":
-                    if parsed_initial.get("content") == "restart":
-                        console_log("Restart command received - treating as new discussion")
-                        discussion_active = False
-                        initial_msg = "start"
-        except json.JSONDecodeError:
-            pass
-    except Exception as e:
-        console_log(f"Error receiving initial message: {e}")
-        return
-
-    if discussion_active:
-        console_log("A discussion is already active")
-        try:
-            iostream.send(json.dumps({
-                "type": "system_message",
-                "content": "A discussion is already in progress."
-            }))
-        except Exception as e:
-            console_log(f"Error sending busy message: {e}")
-        return
-
-    discussion_active = True
+    all_agent_names = [agent.name for agent in all_participants]
+    console_log(f"All agents: {all_agent_names}")
 
     try:
-        teacher = ConversableAgent(
-            name="Teacher",
-            system_message=f"""You are a knowledgeable teacher leading a classroom discussion.
-
-            📜 RULES FOR CALLING ON PARTICIPANTS:
-            - You MUST always call on a specific participant at the end of each message.
-            - Choose ONLY from this list of students: {", ".join([s['name'] for s in student_data])}, or "You" (the human user).
-            - NEVER invent names. If unsure, call on "You" (the human user).
-
-            If you call on an invalid name, the conversation will not progress. Follow these rules strictly.
-
-            🚀 YOUR RESPONSIBILITIES:
-            - Ask thought-provoking questions.
-            - Call on specific students or the human user by name to participate.
-            - Guide the discussion and ensure everyone gets a turn.
-            - Address misconceptions and encourage deeper thinking.
-            - Summarize key points at appropriate moments.
-            - **End discussions gracefully and efficiently without unnecessary repetition.**
-
-            🔥 ALWAYS end your message with a direct call-out:
-            - "[name], what do you think?"
-            - "[name], do you have an example?"
-            - "You, what's your take on this?"
-
-            ❌ Do NOT ask 'anyone' in general.
-            ❌ Do NOT call on non-existent students.
-            ❌ Do NOT end without calling on someone.
-
-            If you do not follow these instructions, the discussion will stall. Stick to the given names.
-
-            📜 RULES FOR ENDING THE DISCUSSION:
-            Always invite "You" (the human user) to share final thoughts before concluding.
-
-            Example: "You, before we wrap up, do you have any final takeaways from today's discussion?"
-            If "You" does not respond or has nothing to add, provide a single final summary and conclude the session.
-
-            DO NOT call on students once the discussion is ending.
-
-            If students have already shared their thoughts, there is no need to ask them again.
-            Wrap up with a clear and warm closing message.
-
-            Example: "Thank you all for the great discussion! Keep thinking critically, and I look forward to our next session!"
-            Optionally, pose a reflective question for students to think about before the next session.
-
-            🛑 FINAL MESSAGE STRUCTURE
-            Once "You" has spoken (or opted out), DO NOT ask more questions. Instead, wrap up with:
-
-            A thank you to participants.
-            A brief summary of key discussion points.
-            An optional reflection question for students to consider.
-            A clear conclusion without starting a new discussion.
+        agent_list_msg = {
+            "type": "agent_list",
+            "content": all_agent_names
+        }
+        iostream.send(json.dumps(agent_list_msg))
+        io_log.debug("Sent agent list to client", extra={"session": session.id})
+    except Exception as e:
+        io_log.warning("Error sending agent list: %s", e, extra={"session": session.id})
 
-            Example Final Message:
-            "Thank you all for today's discussion! We explored X, Y, and Z. Keep thinking critically about these ideas.
-            As a final thought, how might you apply these concepts in real life? See you next time!"
+    async def custom_input(prompt=None):
+        """Handle user input via WebSocket, ensuring structured JSON messages."""
+        io_log.debug("User's turn to respond: %s", prompt, extra={"session": session.id, "event": "input"})
+        session.state = "waiting_for_input"
+        waiting_since = time.monotonic()
 
-            🚨 DO NOT start a new discussion after concluding. Your closing message MUST include "See you next time!"
-            """,
-            description="A teacher facilitating the classroom discussion",
-            llm_config=llm_config
-        )
+        while True:
+            try:
+                raw_message = await iostream.a_input()
 
-        student_agents = []
+                if isinstance(raw_message, str):
+                    raw_message = raw_message.strip()
 
-        for student in student_data:
-            student["system_message"] += f"""
-            **📜 IMPORTANT GUIDELINES FOR PARTICIPATION**
+                try:
+                    parsed_message = json.loads(raw_message) if isinstance(raw_message, str) else raw_message
 
-            1. **Always end your messages by calling on a specific classmate, the teacher, or "You" (the human user).**
-            - **You may only call on:** {", ".join([s['name'] for s in student_data if s['name'] != student['name']])}, "Teacher," or "You."  
-            - **DO NOT call on yourself.** If unsure, call on "Teacher."
+                    if isinstance(parsed_message, dict):
+                        message_type = parsed_message.get("type")
 
-            👀 Examples:
-            - *"What do you think about this, [classmate's name]?"*
-            - *"[classmate's name], have you considered this perspective?"*
-            - *"Teacher, what's your perspective on this?"*
-            - *"You, have you experienced something similar?"*
+                        if message_type == "ping" or parsed_message.get("content") == "keepalive":
+                            io_log.debug("Ping or keepalive received, ignoring", extra={"event": "ping"})
+                            continue
 
-            2. **Make your call-out direct and specific.**
-            - Phrase it as a question that invites a response.
+                        if message_type == "user_message":
+                            session.state = "running"
+                            metrics.human_input_wait.observe(time.monotonic() - waiting_since)
+                            return parsed_message["content"]
 
-            3. **DO NOT end with vague questions.**
-            - ❌ *"What does everyone think?"*
-            - ❌ *"Any thoughts?"*
+                        elif message_type == "terminate":
+                            io_log.info("Exit command received; terminating discussion", extra={"session": session.id})
+                            return "exit"
 
-            4. **Always speak in the first person.**
-            - You are **{student["name"]}**, so **always refer to yourself as "I"**, not in the third person.
+                        elif message_type == "command" and parsed_message.get("content") == "restart":
+                            io_log.info("Restart command received; terminating session", extra={"session": session.id})
+                            return "exit"
 
-            5. **DO NOT answer questions directed at others.**
-            - If another participant is called on, **wait for them to respond.**
-            - 🛑 DO NOT send messages like *"WAITING FOR XYZ TO RESPOND."*
-            - **Simply stay silent until it is your turn.**
-            """
+                        else:
+                            io_log.warning("Unknown message type received: %s", parsed_message, extra={"session": session.id})
+                            return json.dumps(parsed_message)
 
-            student_agent = ConversableAgent(
-                name=student["name"],
-                system_message=student["system_message"],
-                description=student["description"],
-                llm_config=llm_config
-            )
-            student_agents.append(student_agent)
+                    else:
+                        io_log.warning("Could not parse as JSON, returning raw: %.200s", raw_message, extra={"session": session.id})
+                        return json.dumps({"type": "user_message", "content": raw_message})
 
-        user_proxy = UserProxyAgent(
-            name="You",
-            human_input_mode="ALWAYS",
-            system_message="You are participating in a classroom discussion. Share your thoughts when called upon.",
-            description="The human user participating in the discussion",
-            code_execution_config=False,
-            is_termination_msg=lambda x: isinstance(x, str) and x.lower().strip() == "exit" or
-                (isinstance(x, dict) and x.get("content", "").lower().strip() == "exit"),
-        )
+                except json.JSONDecodeError:
+                    io_log.warning("Could not parse as JSON, returning raw: %.200s", raw_message, extra={"session": session.id})
+                    return json.dumps({"type": "user_message", "content": raw_message})
 
-        all_participants = [teacher] + student_agents + [user_proxy]
+            except Exception as e:
+                io_log.warning("Error receiving user input: %s", e, extra={"session": session.id})
+                return "exit"
 
-        all_agent_names = [agent.name for agent in all_participants]
-        console_log(f"All agents: {all_agent_names}")
+    user_proxy.a_get_human_input = custom_input
 
+    def send_message(agent_name, content):
         try:
-            agent_list_msg = {
-                "type": "agent_list",
-                "content": all_agent_names
-            }
-            iostream.send(json.dumps(agent_list_msg))
-            console_log("✅ Sent agent list to client")
-        except Exception as e:
-            console_log(f"🚨 Error sending agent list: {e}")
-
-        def custom_input(prompt=None):
-            """Handle user input via WebSocket, ensuring structured JSON messages."""
-            console_log(f"📝 User's turn to respond: {prompt}")
+            with tracer.span("websocket_send", session.id, session.turn_span, agent=agent_name):
+                iostream.send(agent_message_frame(agent_name, content))
+            io_log.debug("Sent message from %s: %.100s", agent_name, content,
+                         extra={"session": session.id, "event": "send"})
 
-            while True:
+        except Exception as e:
+            io_log.warning("Error sending message from %s (%s): %s; content: %.100r",
+                           agent_name, type(content).__name__, e, content, extra={"session": session.id})
+
+    def traced_handler(handler, agent_name):
+        def message_handler(recipient, messages=None, sender=None, config=None):
+            with tracer.span("message_handler", session.id, session.turn_span, agent=agent_name):
+                result = handler(recipient, messages, sender, config)
+            session.phase_mark = time.time()
+            return result
+        return message_handler
+
+    for agent in all_participants:
+        def create_message_handler(agent_name):
+            def message_handler(recipient, messages=None, sender=None, config=None):
                 try:
-                    raw_message = iostream.input()
-
-                    if isinstance(raw_message, str):
-                        raw_message = raw_message.strip()
-
-                    try:
-                        parsed_message = json.loads(raw_message) if isinstance(raw_message, str) else raw_message
-
-                        if isinstance(parsed_message, dict):
-                            message_type = parsed_message.get("type")
-
-                            if message_type == "ping" or parsed_message.get("content") == "keepalive":
-                                console_log("📡 Ping or keepalive received, ignoring...")
-                                continue
+                    if messages and len(messages) > 0:
+                        last_message = messages[-1]
+                        if last_message.get("role") == "assistant":
+                            content = last_message.get("content", "")
+
+                            if isinstance(content, dict):
+                                content = json.dumps(content)
+                            elif not isinstance(content, str):
+                                content = str(content)
+                            content, _ = parse_structured_reply(content)
+
+                            if content:
+                                send_message(agent_name, content)
+                                io_log.debug("Handled message from %s", agent_name, extra={"event": "handler"})
+                except Exception as e:
+                    io_log.warning("Error in message handler for %s: %s", agent_name, e, extra={"session": session.id})
+                return False, None
+
+            return message_handler
+
+        handler = create_message_handler(agent.name)
+        agent.register_reply(ConversableAgent, traced_handler(handler, agent.name))
+
+    def select_speaker(last_speaker, chat):
+        turn = tracer.next_turn(session)
+        with tracer.span("select_speaker", session.id, turn) as span:
+            next_agent = custom_speaker_selection(last_speaker, chat, iostream, session)
+            span.set(next_speaker=getattr(next_agent, "name", None))
+        turn.set(turn=session.turns, speaker=getattr(next_agent, "name", None))
+        session.phase_mark = session.turn_started = time.time()
+        session.turn_tokens.clear()
+        return next_agent
 
-                            if message_type == "user_message":
-                                return parsed_message["content"]
+    def turn_context(sender):
+        """Transcript columns for the message sender is about to send."""
+        if sender.name != session.current_speaker:
+            return {"turn": session.turns}
+        return {
+            "turn": session.turns,
+            "routing_rule": session.route_rule,
+            "latency_ms": round(1000 * (time.time() - session.turn_started), 1) if session.turn_started else None,
+            "prompt_tokens": session.turn_tokens["prompt_tokens"],
+            "completion_tokens": session.turn_tokens["completion_tokens"],
+        }
 
-                            elif message_type == "terminate":
-                                console_log("🛑 Exit command received. Terminating discussion.")
-                                return "exit"
+    group_chat = GroupChat(
+        agents=all_participants,
+        messages=[],
+        max_round=30,
+        speaker_selection_method=require_agent_selection(select_speaker) if MANAGER_OFFLINE else select_speaker,
+        allow_repeat_speaker=False
+    )
+
+    session.group_chat = group_chat
+
+    chat_manager = pooled_agent(
+        GroupChatManager,
+        groupchat=group_chat,
+        name="chat_manager",
+        llm_config=agent_llm_config(llm_config, "manager"),
+    )
+    def report_missed_deadline(agent, error):
+        llm_log.warning("%s", error, extra={"session": session.id, "agent": agent.name})
+        try:
+            session.iostream.send(json.dumps({
+                "type": "system_message",
+                "content": f"{agent.name} is taking too long to answer, so the discussion is moving on."
+            }))
+        except Exception as e:
+            io_log.warning("Error sending deadline message: %s", e, extra={"session": session.id})
+
+    counter = count_calls(session.llm_calls)
+    for agent in [teacher] + student_agents:
+        # counter sits inside the hedger so hedged duplicates are counted as attempts too.
+        install_middleware(agent, count_tokens(session.turn_tokens), llm_span_middleware(tracer, session),
+                           hedger, counter, rate_limiter.for_session(session.id), usage_tracker, hedger.route)
+        guard_turn(agent, report_missed_deadline)
+    if MANAGER_OFFLINE:
+        install_middleware(chat_manager, counter, refuse_calls)
+    else:
+        install_middleware(chat_manager, counter, rate_limiter.for_session(session.id), usage_tracker)
+    attach_cache(all_participants + [chat_manager], llm_cache)
+    if transcripts:
+        attach_transcript(all_participants, transcripts, session.id, turn_context)
+    return user_proxy, chat_manager
+
+START_MESSAGE = """Start a classroom discussion about an interesting scientific concept that students might find challenging. 
+            Begin by introducing the topic, explaining why it's important, and asking an open-ended question that encourages critical thinking.
+            Keep the discussion engaging and educational, drawing connections to real-world applications when possible.
+            After your introduction, call on a specific student by name to respond."""
 
-                            elif message_type == "command" and parsed_message.get("content") == "restart":
-                                console_log("🔄 Restart command received. Terminating session.")
-                                return "exit"
+async def prepare_warm_session():
+    """Build a session and generate the Teacher's opener before any client arrives."""
+    stream = ResumableStream(RESUME_GRACE_SECONDS, RESUME_BUFFER_FRAMES)
+    session = Session(stream)
+    user_proxy, chat_manager = build_classroom(stream, session)
+    teacher = session.agents[0]
+    start = {"content": START_MESSAGE, "name": user_proxy.name, "role": "user"}
+    with IOStream.set_default(session.iostream):
+        opener = await teacher.a_generate_reply(messages=[start])
+    if isinstance(opener, dict):
+        opener = opener.get("content", "")
+    if not opener:
+        raise ValueError("Teacher returned an empty opener")
+    return WarmSession(stream, session, user_proxy, chat_manager, [
+        start,
+        {"content": opener, "name": teacher.name, "role": "assistant"},
+    ])
+
+warm_pool = WarmPool(WARM_POOL_SIZE, WARM_POOL_TTL, prepare_warm_session) if WARM_POOL_SIZE > 0 else None
+
+# Session token -> ResumableStream of every discussion in this process.
+resumable = {}
+
+def issue_session_token(token, stream, session):
+    """Register stream under token and tell the client how to resume it."""
+    resumable[token] = stream
+    stream.send(json.dumps({
+        "type": "session",
+        "token": token,
+        "session": session.id,
+        "resume_grace_seconds": RESUME_GRACE_SECONDS
+    }))
+
+async def resume_session(iostream, request):
+    """Reattach a reconnecting client to its discussion and hold the connection until it is released."""
+    stream = resumable.get(request.get("token"))
+    if stream is None:
+        try:
+            iostream.send(json.dumps({
+                "type": "error",
+                "code": "session_not_found",
+                "message": "This discussion has ended or can no longer be resumed."
+            }))
+        except Exception as e:
+            io_log.warning("Error sending resume failure: %s", e)
+        await iostream.aclose()
+        return
+    try:
+        last_seq = int(request.get("last_seq") or 0)
+    except (TypeError, ValueError):
+        last_seq = 0
+    console_log(f"[WebSocket] Client resumed a discussion from frame {last_seq}")
+    try:
+        released = stream.attach(iostream, last_seq)
+    except ConnectionError:
+        return
+    await released
+    await iostream.aclose()
 
-                            else:
-                                console_log(f"⚠️ Unknown message type received: {parsed_message}")
-                                return json.dumps(parsed_message)
+async def on_connect(websocket) -> None:
+    """Handle new WebSocket connection and start classroom discussion."""
+    iostream = WebSocketStream(websocket)
+    console_log(f"[WebSocket] New client connected: {websocket.remote_address}")
 
-                        else:
-                            console_log(f"⚠️ Could not parse as JSON, returning raw: {raw_message}")
-                            return json.dumps({"type": "user_message", "content": raw_message})
+    try:
+        initial_msg = await iostream.a_input()
+        console_log(f"Initial message from client: {initial_msg}")
 
-                    except json.JSONDecodeError:
-                        console_log(f"⚠️ Could not parse as JSON, returning raw: {raw_message}")
-                        return json.dumps({"type": "user_message", "content": raw_message})
+        try:
+            if isinstance(initial_msg, str):
+                parsed_initial = json.loads(initial_msg)
+                if isinstance(parsed_initial, dict) and parsed_initial.get("type") == "resume":
+                    await resume_session(iostream, parsed_initial)
+                    return
+                if isinstance(parsed_initial, dict) and parsed_initial.get("type") == "command":
+                    if parsed_initial.get("content") == "restart":
+                        console_log("Restart command received - treating as new discussion")
+                        initial_msg = "start"
+                    elif parsed_initial.get("content") == "start":
+                        initial_msg = "start"
+        except json.JSONDecodeError:
+            pass
+    except Exception as e:
+        console_log(f"Error receiving initial message: {e}")
+        await iostream.aclose()
+        return
 
-                except Exception as e:
-                    console_log(f"🚨 Error receiving user input: {e}")
-                    return "exit"
+    def report_queue_position(position, estimated_wait):
+        minutes = max(1, round(estimated_wait / 60))
+        iostream.send(json.dumps({
+            "type": "system_message",
+            "content": f"All classrooms are busy. You are number {position} in line (about {minutes} min).",
+            "position": position,
+            "estimated_wait_seconds": round(estimated_wait)
+        }))
 
-        user_proxy.get_human_input = custom_input
+    try:
+        session = await sessions.admit(iostream, report_queue_position, QUEUE_UPDATE_SECONDS)
+    except Exception as e:
+        console_log(f"Client left the admission queue: {e}")
+        await iostream.aclose()
+        return
 
-        def send_message(agent_name, content):
-            try:
-                console_log(f"📤 Sending message from {agent_name}: {content[:100]}...")
-
-                if isinstance(content, dict):
-                    content_str = json.dumps(content)
-                elif not isinstance(content, str):
-                    content_str = str(content)
-                else:
-                    content_str = content
-
-                message_data = {
-                    "type": "agent_message",
-                    "agent": agent_name,
-                    "content": content_str
-                }
+    if session is None:
+        console_log(f"All {MAX_SESSIONS} classrooms and {SESSION_QUEUE_DEPTH} queue places are in use")
+        try:
+            iostream.send(json.dumps({
+                "type": "error",
+                "code": 503,
+                "message": "All classrooms are currently busy. Please try again shortly."
+            }))
+        except Exception as e:
+            console_log(f"Error sending busy message: {e}")
+        await iostream.aclose(1013, "Server busy")
+        return
 
-                json_str = json.dumps(message_data)
-                iostream.send(json_str)
-                console_log(f"✅ Sent message from {agent_name}: {content_str[:50]}...")
+    console_log(f"[Session {session.id}] Opened ({len(sessions)}/{MAX_SESSIONS} active)")
 
-            except Exception as e:
-                console_log(f"🚨 Error sending message: {e}")
-                console_log(f"🚨 ERROR OCCURRED! Object Type: {type(content)} Content: {repr(content)[:100]}")
-
-        for agent in all_participants:
-            def create_message_handler(agent_name):
-                def message_handler(recipient, messages=None, sender=None, config=None):
-                    try:
-                        if messages and len(messages) > 0:
-                            last_message = messages[-1]
-                            if last_message.get("role") == "assistant":
-                                content = last_message.get("content", "")
-
-                                if isinstance(content, dict):
-                                    content = json.dumps(content)
-                                elif not isinstance(content, str):
-                                    content = str(content)
-
-                                if content:
-                                    send_message(agent_name, content)
-                                    console_log(f"✅ Handled message from {agent_name}")
-                    except Exception as e:
-                        console_log(f"🚨 Error in message handler for {agent_name}: {e}")
-                    return False, None
-
-                return message_handler
-
-            handler = create_message_handler(agent.name)
-            agent.register_reply(ConversableAgent, handler)
-
-        group_chat = GroupChat(
-            agents=all_participants,
-            messages=[],
-            max_round=30,
-            speaker_selection_method=lambda last_speaker, chat: custom_speaker_selection(last_speaker, chat, iostream),
-            allow_repeat_speaker=False
-        )
-
-        chat_manager = GroupChatManager(
-            groupchat=group_chat,
-            name="chat_manager",
-            llm_config=llm_config,
-        )
-
-        if isinstance(initial_msg, str) and initial_msg.lower() == "start":
-            start_msg = """Start a classroom discussion about an interesting scientific concept that students might find challenging. 
-            Begin by introducing the topic, explaining why it's important, and asking an open-ended question that encourages critical thinking.
-            Keep the discussion engaging and educational, drawing connections to real-world applications when possible.
-            After your introduction, call on a specific student by name to respond."""
-        else:
-            start_msg = initial_msg
+    stream = None
+    token = secrets.token_urlsafe(24)
+    try:
+        is_start = isinstance(initial_msg, str) and initial_msg.lower() == "start"
+        warm = warm_pool.claim() if warm_pool and is_start else None
 
         try:
-            user_proxy.initiate_chat(chat_manager, message={"type": "start_message", "content": start_msg})
-            console_log("✅ user_proxy.initiate_chat() started successfully.")
+            if warm:
+                console_log(f"[Session {session.id}] Claimed warm session {warm.session.id}")
+                session = sessions.adopt(session, warm.session)
+                stream = warm.stream
+                stream.attach(iostream)
+                issue_session_token(token, stream, session)
+                session.trace = tracer.start_span("session", session.id, warm=True)
+                if transcripts:
+                    # a_resume and a_initiate_chat send the openers through the transcript hook.
+                    transcripts.open_session(session.id, warm=True)
+                session.state = "running"
+                with IOStream.set_default(session.iostream):
+                    last_agent, last_message = await warm.chat_manager.a_resume(messages=warm.opening_messages)
+                    await last_agent.a_initiate_chat(warm.chat_manager, message=last_message, clear_history=False, cache=llm_cache)
+            else:
+                stream = ResumableStream(RESUME_GRACE_SECONDS, RESUME_BUFFER_FRAMES)
+                stream.attach(iostream)
+                session.iostream = stream
+                issue_session_token(token, stream, session)
+                user_proxy, chat_manager = build_classroom(stream, session)
+                start_msg = START_MESSAGE if is_start else initial_msg
+                session.trace = tracer.start_span("session", session.id, warm=False)
+                if transcripts:
+                    transcripts.open_session(session.id, warm=False)
+                session.state = "running"
+                with IOStream.set_default(session.iostream):
+                    await user_proxy.a_initiate_chat(chat_manager, message={"type": "start_message", "content": start_msg}, cache=llm_cache)
+            console_log("✅ Classroom chat finished successfully.")
         except Exception as e:
-            console_log(f"🚨 ERROR in initiate_chat: {e}")
+            console_log(f"🚨 ERROR in classroom chat: {e}")
 
     except Exception as e:
         console_log(f"Error in classroom discussion: {e}")
@@ -496,14 +808,22 @@ def on_connect(iostream: IOWebsockets) -> None:
                 "message": str(e)
             }
             error_json = json.dumps(error_data)
-            iostream.send(error_json)
+            (stream or iostream).send(error_json)
             console_log(f"DEBUG: Sent error message: {error_json}")
         except Exception as ws_error:
             console_log(f"WebSocket send error in on_connect: {ws_error}")
 
     finally:
-        discussion_active = False
-        console_log("Classroom discussion has concluded.")
+        session.state = "concluded"
+        tracer.end_session(session)
+        if transcripts:
+            transcripts.close_session(session.id, session.state, session.turns)
+        sessions.close(session.id)
+        resumable.pop(token, None)
+        if stream is not None:
+            await stream.aclose()
+        await iostream.aclose()
+        console_log(f"[Session {session.id}] Classroom discussion has concluded.")
 
 html = """
 <!DOCTYPE html>
@@ -1113,6 +1433,17 @@ html = """
                 }
             }
 
+            function unwrapReply(content) {
+                if (typeof content !== "string" || !content.trim().startsWith("{")) return content;
+                try {
+                    const payload = JSON.parse(content);
+                    if (payload && typeof payload.reply === "string") return payload.reply;
+                } catch (e) {
+                    console.warn("⚠️ Failed to parse structured reply:", content);
+                }
+                return content;
+            }
+
             function findCalledAgent(messageContent) {
                 if (!messageContent) return null;
 
@@ -1251,6 +1582,7 @@ html = """
             }
 
             function addAgentMessage(agent, content) {
+                content = unwrapReply(content);
                 const messageEl = document.createElement('div');
                 messageEl.className = `message ${agent.toLowerCase()}`;
 
@@ -1299,6 +1631,64 @@ html = """
                 }
             }
 
+            const streamingMessages = {};
+            const streamedAgents = {};
+
+            // AG2 text events name the sender "sender" (0.8 and later) or "sender_name" (0.7).
+            function textSender(message) {
+                return message.content.sender || message.content.sender_name;
+            }
+
+            function addAgentMessageDelta(message) {
+                let entry = streamingMessages[message.id];
+                if (!entry) {
+                    hideTypingIndicator();
+                    const messageEl = document.createElement('div');
+                    messageEl.className = `message ${message.agent.toLowerCase()}`;
+
+                    const now = new Date();
+                    const time = now.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
+
+                    messageEl.innerHTML = `
+                        <div class="sender">
+                            <span class="name">${message.agent}</span>
+                            <span class="time">${time}</span>
+                        </div>
+                        <div class="content"></div>
+                    `;
+
+                    messagesContainer.appendChild(messageEl);
+                    entry = { contentEl: messageEl.querySelector('.content'), text: '', nextIndex: 0, early: {} };
+                    streamingMessages[message.id] = entry;
+                    streamedAgents[message.agent] = message.id;
+                }
+
+                entry.early[message.index] = message.delta;
+                while (entry.nextIndex in entry.early) {
+                    entry.text += entry.early[entry.nextIndex];
+                    delete entry.early[entry.nextIndex];
+                    entry.nextIndex += 1;
+                }
+                entry.contentEl.textContent = entry.text;
+                scrollToBottom();
+            }
+
+            function finishStreamedMessage(id, content) {
+                const entry = streamingMessages[id];
+                if (!entry) return false;
+
+                content = unwrapReply(content);
+                entry.contentEl.textContent = content;
+                delete streamingMessages[id];
+                scrollToBottom();
+
+                const calledAgent = findCalledAgent(content);
+                if (calledAgent) {
+                    updateTurnIndicator(calledAgent);
+                }
+                return true;
+            }
+
             function addSystemMessage(content) {
                 const messageEl = document.createElement('div');
                 messageEl.className = 'message system';
@@ -1450,6 +1840,7 @@ html = """
                 if (confirm('Restart the classroom discussion?')) {
                     messagesContainer.innerHTML = '';
                     addSystemMessage('Restarting classroom discussion...');
+                    forgetSession();
 
                     if (ws && (ws.readyState === WebSocket.OPEN || ws.readyState === WebSocket.CONNECTING)) {
                         try {
@@ -1480,6 +1871,24 @@ html = """
             let userTurn = false;
             let typing = false;
 
+            // Resume state: the token the server issued for this discussion, the last
+            // frame seq received, and the key that routes a reconnect to the same worker.
+            let sessionKey = newSessionKey();
+            let sessionToken = null;
+            let lastSeq = 0;
+            let resumeAttempts = 0;
+
+            function newSessionKey() {
+                return (window.crypto && crypto.randomUUID) ? crypto.randomUUID() : Math.random().toString(36).slice(2);
+            }
+
+            function forgetSession() {
+                sessionKey = newSessionKey();
+                sessionToken = null;
+                lastSeq = 0;
+                resumeAttempts = 0;
+            }
+
             function connectWebSocket() {
                 if ((ws && ws.readyState === WebSocket.OPEN) ||
                     (ws && ws.readyState === WebSocket.CONNECTING && !reconnecting)) {
@@ -1499,11 +1908,21 @@ html = """
                     console.log("WebSocket connection opened");
                     updateConnectionStatus('connected', 'Connected');
                     connecting = false;
-                    const startCommand = JSON.stringify({
-                        "type": "command",
-                        "content": "start"
-                    });
-                    ws.send(startCommand);
+                    if (sessionToken) {
+                        ws.send(JSON.stringify({
+                            "type": "resume",
+                            "token": sessionToken,
+                            "last_seq": lastSeq,
+                            "session": sessionKey
+                        }));
+                    } else {
+                        const startCommand = JSON.stringify({
+                            "type": "command",
+                            "content": "start",
+                            "session": sessionKey
+                        });
+                        ws.send(startCommand);
+                    }
                     startHeartbeat();
                 };
 
@@ -1513,6 +1932,17 @@ html = """
                     try {
                         const message = JSON.parse(event.data);
                         console.log("Parsed message:", message);
+                        if (typeof message.seq === "number") {
+                            if (message.seq <= lastSeq) {
+                                return;
+                            }
+                            lastSeq = message.seq;
+                        }
+                        if (message.type === "session") {
+                            sessionToken = message.token;
+                            resumeAttempts = 0;
+                            return;
+                        }
                         if (message.type === "text" && typeof message.content === "object" && message.content.content) {
                             let innerContent = message.content.content;
 
@@ -1528,12 +1958,18 @@ html = """
                                 }
                             }
                         }
-                        if (message.type === "agent_message") {
+                        if (message.type === "agent_message_delta") {
+                            addAgentMessageDelta(message);
+                        }
+                        else if (message.type === "agent_message" && message.id && finishStreamedMessage(message.id, message.content)) {
+                            console.log(`Finished streamed message ${message.id} from ${message.agent}`);
+                        }
+                        else if (message.type === "agent_message") {
                             addAgentMessage(message.agent, message.content);
                             hideTypingIndicator();
 
                             if (message.agent !== "You") {
-                                const calledAgent = findCalledAgent(message.content);
+                                const calledAgent = findCalledAgent(unwrapReply(message.content));
                                 console.log("Called agent detected:", calledAgent);
 
                                 if (calledAgent) {
@@ -1555,13 +1991,19 @@ html = """
                         }
                         else if (message.type === "terminate") {
                             addSystemMessage("The discussion has ended.");
+                            forgetSession();
+                        }
+                        else if (message.type === "text" && message.content && streamedAgents[textSender(message)]) {
+                            const streamedId = streamedAgents[textSender(message)];
+                            delete streamedAgents[textSender(message)];
+                            finishStreamedMessage(streamedId, message.content.content);
                         }
                         else if (message.type === "text") {
-                            if (message.content && message.content.sender_name) {
-                                addAgentMessage(message.content.sender_name, message.content.content);
+                            if (message.content && textSender(message)) {
+                                addAgentMessage(textSender(message), message.content.content);
 
-                                if (message.content.sender_name !== "You") {
-                                    const calledAgent = findCalledAgent(message.content.content);
+                                if (textSender(message) !== "You") {
+                                    const calledAgent = findCalledAgent(unwrapReply(message.content.content));
                                     if (calledAgent === "You") {
                                         userTurn = true;
                                         updateUserTurnVisual(true);
@@ -1571,6 +2013,9 @@ html = """
                             }
                         }
                         else if (message.type === "error") {
+                            if (message.code === "session_not_found") {
+                                forgetSession();
+                            }
                             addSystemMessage("Error: " + message.message);
                         }
                         else {
@@ -1582,9 +2027,16 @@ html = """
                 };
 
                 ws.onclose = function() {
-                    updateConnectionStatus('disconnected', 'Disconnected');
                     console.log("WebSocket connection closed");
                     connecting = false;
+                    if (sessionToken && resumeAttempts < 10) {
+                        const delay = Math.min(1000 * 2 ** resumeAttempts, 15000);
+                        resumeAttempts++;
+                        updateConnectionStatus('connecting', 'Reconnecting...');
+                        setTimeout(connectWebSocket, delay);
+                        return;
+                    }
+                    updateConnectionStatus('disconnected', 'Disconnected');
                 };
 
                 ws.onerror = function(error) {
@@ -1614,16 +2066,58 @@ html = """
 </html>
 """
 
+async def start_session_services():
+    """Set up the LLM executor and warm pool in a process that hosts sessions."""
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm")
+    )
+    if warm_pool:
+        await warm_pool.start()
+
+def worker_http(connection, request):
+    """Answer GET /metrics, /debug/traces and /sessions on a worker's WebSocket port, since all are per process."""
+    url = urlsplit(request.path)
+    if url.path == "/metrics":
+        return connection.respond(HTTPStatus.OK, metrics.REGISTRY.render())
+    if url.path == "/sessions":
+        return connection.respond(HTTPStatus.OK, json.dumps({"sessions": len(sessions), "resumable": len(resumable)}))
+    if url.path == "/debug/traces":
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        traces = tracer.traces(query.get("session"), int(query.get("limit", 20)))
+        return connection.respond(HTTPStatus.OK, json.dumps({"enabled": tracer.enabled, "traces": traces}))
+    return None
+
+async def serve_sessions(host, port):
+    """Run a discussion server until cancelled; the entry point of pool workers."""
+    await start_session_services()
+    async with serve(on_connect, host, port, process_request=worker_http):
+        console_log(f"Worker WebSocket server started at ws://{host}:{port}")
+        await asyncio.Future()
+
 @asynccontextmanager
 async def lifespan(app):
     """Application lifespan context manager."""
     try:
-        with IOWebsockets.run_server_in_thread(on_connect=on_connect, port=8080) as uri:
-            console_log(f"WebSocket server started at {uri}")
-            yield
+        if worker_pool:
+            await worker_pool.start()
+            async with serve(worker_pool.proxy, "127.0.0.1", 8080):
+                console_log(f"WebSocket front started at ws://127.0.0.1:8080 with {WORKERS} workers")
+                yield
+        else:
+            await start_session_services()
+            async with serve(on_connect, "127.0.0.1", 8080):
+                console_log("WebSocket server started at ws://127.0.0.1:8080")
+                yield
     except Exception as e:
         console_log(f"Error running WebSocket server: {e}")
     finally:
+        if worker_pool:
+            await worker_pool.stop()
+        if warm_pool:
+            await warm_pool.stop()
+        tracer.close()
+        if transcripts:
+            transcripts.close()
         console_log("WebSocket server stopped")
 
 app = FastAPI(lifespan=lifespan)
@@ -1644,13 +2138,95 @@ async def get():
     """Serve the HTML interface."""
     return HTMLResponse(html)
 
+def register_metrics():
+    """Export the server's existing counters through the metrics registry."""
+    registry = metrics.REGISTRY
+    registry.gauge("classroom_sessions_active", "Discussions currently running in this process.").set_function(
+        lambda: len(sessions))
+    registry.gauge("classroom_sessions_queued", "Connections waiting for a free classroom.").set_function(
+        lambda: sessions.queued)
+    registry.counter("classroom_sessions_rejected_total", "Connections turned away at capacity.").set_function(
+        lambda: sessions.rejected)
+    registry.counter("classroom_routing_decisions_total", "Speaker routing decisions by rule; "
+                     "\"fallback\" means nobody was called on and the Teacher was chosen.", ["rule"]).set_function(
+        lambda: dict(routing_stats))
+    registry.counter("classroom_llm_call_attempts_total", "LLM completions requested, by caller, including cache hits.", ["caller"]).set_function(
+        lambda: dict(call_counts))
+    registry.gauge("classroom_warm_sessions_ready", "Prepared sessions waiting in the warm pool.").set_function(
+        lambda: warm_pool.snapshot()["ready"] if warm_pool else 0)
+    registry.gauge("classroom_llm_concurrency_limit", "Adaptive limit on LLM calls in flight.").set_function(
+        lambda: rate_limiter.limit)
+
+register_metrics()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics for this process."""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/debug/traces")
+async def debug_traces(session: str = "", limit: int = 20):
+    """Recent finished spans grouped by session, newest first (TRACING=1)."""
+    return {"enabled": tracer.enabled, "traces": tracer.traces(session, limit)}
+
+@app.get("/transcripts")
+def list_transcripts(limit: int = 50, agent: str = "", since: float = 0):
+    """Recent sessions in the transcript store, optionally those in which agent spoke."""
+    if not transcripts:
+        raise HTTPException(status_code=404, detail="TRANSCRIPT_PATH is not set")
+    return {"sessions": transcripts.recent_sessions(limit, agent or None, since)}
+
+@app.get("/transcripts/{session_id}")
+def get_transcript(session_id: str):
+    """One session's messages in order."""
+    if not transcripts:
+        raise HTTPException(status_code=404, detail="TRANSCRIPT_PATH is not set")
+    return {"session_id": session_id, "messages": transcripts.session_messages(session_id)}
+
+@app.get("/search")
+def search(q: str, agent: str = "", session: str = "", limit: int = 20, raw: bool = False):
+    """Full-text search over stored messages, with snippets and session and turn pointers."""
+    if not transcripts:
+        raise HTTPException(status_code=404, detail="TRANSCRIPT_PATH is not set")
+    try:
+        hits = transcripts.search(q, agent or None, session or None, min(limit, 200), raw)
+    except sqlite3.OperationalError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid search query: {e}")
+    return {"query": q, "hits": hits}
+
 @app.get("/status")
 async def status():
     """Return server status."""
+    workers = worker_pool.snapshot() if worker_pool else []
     return {
         "status": "running",
-        "discussion_active": discussion_active
+        "discussion_active": len(sessions) > 0 or any(w["sessions"] for w in workers),
+        "max_sessions": MAX_SESSIONS,
+        "queued_sessions": sessions.queued,
+        "rejected_sessions": sessions.rejected,
+        "sessions": sessions.snapshot(),
+        "resumable_sessions": len(resumable),
+        "workers": workers,
+        "warm_pool": warm_pool.snapshot() if warm_pool else None,
+        "routing": dict(routing_stats),
+        "llm_cache": llm_cache.stats() if llm_cache else None,
+        "compaction": compaction_snapshot(),
+        "llm_usage": usage_tracker.snapshot(),
+        "llm_call_attempts": dict(call_counts),
+        "llm_pool": rate_limiter.snapshot(),
+        "deadlines": hedger.snapshot(),
+        "tracing": tracer.snapshot(),
+        "transcripts": transcripts.snapshot() if transcripts else None,
+        "manager_offline": MANAGER_OFFLINE
     }
 
+@app.post("/workers/{index}/recycle")
+async def recycle_worker(index: int):
+    """Drain a worker process and restart it once its sessions have finished."""
+    if not worker_pool or not 0 <= index < WORKERS:
+        raise HTTPException(status_code=404, detail="No such worker")
+    worker_pool.recycle(index)
+    return worker_pool.snapshot()[index]
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=PORT)
\ No newline at end of file
@@ -2,9 +2,16 @@ import os
 import json
 import re
 import random
+import uuid
 import autogen
 from autogen import UserProxyAgent, GroupChat, GroupChatManager, ConversableAgent
 from dotenv import load_dotenv
+from routing import get_router
+from llm_cache import cache_from_env, attach_cache
+from compaction import add_compaction
+from model_tiers import agent_llm_config
+from llm_calls import install_middleware, refuse_calls, require_agent_selection
+from transcripts import store_from_env, attach_transcript
 
 load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
@@ -44,7 +51,7 @@ for student in student_data:
             name=student["name"],
             system_message=student["system_message"],
             description=student["description"],
-            llm_config=llm_config
+            llm_config=agent_llm_config(llm_config, "student", student)
         )
     )
 
@@ -106,7 +113,7 @@ teacher = ConversableAgent(
     any thoughts on this topic, You?"
     """,
     description="The teacher who facilitates the classroom discussion with expertise on the topic",
-    llm_config=llm_config
+    llm_config=agent_llm_config(llm_config, "teacher", {"name": "Teacher"})
 )
 
 # More comprehensive function to find who was called on in the last message
@@ -115,47 +122,10 @@ def find_next_speaker(last_message_content, agent_names):
     if "human user" in last_message_content:
         return "You"
 
-    # Check for direct mentions at the end of the message
-    sentences = re.split(r'[.!?]\s+', last_message_content)
-    sentences = [s for s in sentences if s.strip()]
-
-    if sentences:
-        last_two_sentences = sentences[-2:] if len(sentences) >= 2 else sentences
-        for sentence in last_two_sentences:
-            for name in agent_names:
-                # Exact name match with word boundaries
-                pattern = r'\b{}\b'.format(re.escape(name))
-                if re.search(pattern, sentence):
-                    return name
-
-    # Check for specific calling patterns
-    patterns = [
-        r"(?:^|\W)(Alvin|Bianca|Charlie|You|Teacher)(?:,|\.|\?|!|\s).*?\?$",
-        r"(?:^|\W)(Alvin|Bianca|Charlie|You|Teacher)(?:,|\.|\?|!|\s).*thoughts",
-        r"(?:^|\W)(Alvin|Bianca|Charlie|You|Teacher)(?:,|\.|\?|!|\s).*think",
-        r"Let's hear from\s+(Alvin|Bianca|Charlie|You|Teacher)",
-        r"(Alvin|Bianca|Charlie|You|Teacher),\s+would you",
-        r"What (?:do|about|are) (?:you|your).*,\s+(Alvin|Bianca|Charlie|You|Teacher)",
-        r"(Alvin|Bianca|Charlie|You|Teacher),\s+what",
-        r"What do you think,?\s+(Alvin|Bianca|Charlie|You|Teacher)",
-        r"Do you (?:have|think).*,?\s+(Alvin|Bianca|Charlie|You|Teacher)",
-        r"How about you,?\s+(Alvin|Bianca|Charlie|You|Teacher)",
-        r"(Alvin|Bianca|Charlie|You|Teacher),\s+(?:do|can|could) you",
-        r"(?:Do|Can|Could|Would) (Alvin|Bianca|Charlie|You|Teacher)",
-        r"I'd like to hear from\s+(Alvin|Bianca|Charlie|You|Teacher)",
-        r"(Alvin|Bianca|Charlie|You|Teacher)\s+(?:should|could|would) (?:you|your)",
-        r"hear (?:your|) thoughts,?\s+(Alvin|Bianca|Charlie|You|Teacher)",
-        r"ask\s+(Alvin|Bianca|Charlie|You|Teacher)",
-    ]
-
-    for pattern in patterns:
-        matches = re.findall(pattern, last_message_content, re.IGNORECASE)
-        if matches:
-            for match in matches:
-                if isinstance(match, tuple):
-                    match = match[0]  # Extract from tuple if needed
-                if match in agent_names:
-                    return match
+    # Check for direct mentions at the end of the message, then for specific calling patterns
+    called = get_router(agent_names).find(last_message_content)
+    if called:
+        return called
 
     # Special handling for "human user" or similar variations
     patterns = [
@@ -194,15 +164,24 @@ def custom_speaker_selection(last_speaker, group_chat):
     else:
         return random.choice(group_chat.agents)
 
+# Keep recent turns verbatim and summarise older ones so prompts stop growing
+keep_last = int(os.getenv("COMPACTION_KEEP_LAST", "8"))
+if keep_last:
+    for agent in [teacher] + student_agents:
+        add_compaction(agent, keep_last=keep_last, max_tokens=int(os.getenv("COMPACTION_MAX_TOKENS", "0")) or None)
+
 # All participants
 all_participants = [teacher] + student_agents + [user_proxy]
 
+# Speaker selection is rule-based; the manager must never call the model itself
+manager_offline = os.getenv("MANAGER_OFFLINE", "1").lower() in ("1", "true", "yes")
+
 # Create the group chat with custom speaker selection
 group_chat = GroupChat(
     agents=all_participants,
     messages=[],
     max_round=30,
-    speaker_selection_method=custom_speaker_selection,
+    speaker_selection_method=require_agent_selection(custom_speaker_selection) if manager_offline else custom_speaker_selection,
     allow_repeat_speaker=False,
     send_introductions=True
 )
@@ -211,9 +190,23 @@ group_chat = GroupChat(
 chat_manager = GroupChatManager(
     groupchat=group_chat,
     name="chat_manager",
-    llm_config=llm_config,
+    llm_config=agent_llm_config(llm_config, "manager"),
 )
 
+if manager_offline:
+    install_middleware(chat_manager, refuse_calls)
+
+# Reuse recorded completions when LLM_CACHE_PATH is set
+llm_cache = cache_from_env()
+attach_cache(all_participants + [chat_manager], llm_cache)
+
+# Append each message to the transcript store when TRANSCRIPT_PATH is set
+transcripts = store_from_env()
+session_id = uuid.uuid4().hex
+if transcripts:
+    transcripts.open_session(session_id, source=os.path.basename(__file__))
+    attach_transcript(all_participants, transcripts, session_id)
+
 # Topic for discussion
 default_topic = "Bulk flow in physiology"
 
@@ -229,7 +222,12 @@ initial_prompt = f"""
 # Start the group chat
 result = user_proxy.initiate_chat(
     chat_manager,
-    message=initial_prompt
+    message=initial_prompt,
+    cache=llm_cache
 )
 
+if transcripts:
+    transcripts.close_session(session_id, "concluded", len(group_chat.messages))
+    transcripts.close()
+
 print("Classroom discussion concluded!")
@@ -0,0 +1,136 @@
+"""Persistent SQLite cache for LLM responses.
+
+Implements AG2's cache protocol (get/set/close and the context manager), so
+an instance can be passed as `cache=` to initiate_chat or set as an agent's
+client_cache. AG2 derives the key from the normalised request: model,
+messages and sampling parameters, without credentials. Entries expire after a
+TTL, and the least recently used ones are evicted once the store exceeds its
+size budget. In replay mode a miss raises instead of calling the model, so
+demos and regression runs can be pinned to recorded responses.
+"""
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+
+class CacheMissError(LookupError):
+    """Raised on a miss when the cache is in replay (cache-only) mode."""
+
+
+class SQLiteResponseCache:
+    """Size-bounded LRU response cache with TTL and hit/miss counters."""
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, ttl=None, replay=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def _digest(key):
+        return hashlib.sha256(str(key).encode("utf-8")).hexdigest()
+
+    def get(self, key, default=None):
+        digest = self._digest(key)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, size, created FROM responses WHERE key = ?", (digest,)).fetchone()
+            if row and self.ttl is not None and row[2] + self.ttl < now:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (digest,))
+                self._bytes -= row[1]
+                row = None
+            if row is None:
+                self.misses += 1
+                if self.replay:
+                    raise CacheMissError(f"No cached response for request {digest[:12]} (replay mode)")
+                return default
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, digest))
+            self.hits += 1
+        return pickle.loads(row[0])
+
+    def set(self, key, value):
+        digest = self._digest(key)
+        blob = pickle.dumps(value)
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (digest,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (digest, blob, len(blob), now, now),
+            )
+            self._bytes += len(blob) - (old[0] if old else 0)
+            self._evict()
+
+    def _evict(self):
+        # Called with the lock held.
+        while self._bytes > self.max_bytes:
+            rows = self._db.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 32").fetchall()
+            if not rows:
+                break
+            for digest, size in rows:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (digest,))
+                self._bytes -= size
+                self.evictions += 1
+                if self._bytes <= self.max_bytes:
+                    break
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {
+            "entries": entries,
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "replay": self.replay,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # AG2 enters and exits the cache around every request; stay open.
+        return None
+
+
+def cache_from_env():
+    """Build the cache configured by LLM_CACHE_PATH and friends, or return None."""
+    path = os.getenv("LLM_CACHE_PATH")
+    if not path:
+        return None
+    ttl = os.getenv("LLM_CACHE_TTL")
+    return SQLiteResponseCache(
+        path,
+        max_bytes=int(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024,
+        ttl=float(ttl) if ttl else None,
+        replay=os.getenv("LLM_CACHE_REPLAY", "").lower() in ("1", "true", "yes"),
+    )
+
+
+def attach_cache(agents, cache):
+    """Make every agent consult `cache` before calling the model."""
+    if cache is None:
+        return
+    for agent in agents:
+        agent.client_cache = cache
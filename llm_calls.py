@@ -0,0 +1,146 @@
+"""Middleware around each agent's LLM client.
+
+install_middleware(agent, ...) wraps agent.client so every completion the
+agent requests runs through a chain of middlewares. The underlying client is
+left untouched, so it can be shared between agents. A middleware is called
+as middleware(call_next, agent, params) and returns the response, usually by
+calling call_next(params). The first middleware given is the outermost.
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+
+import metrics
+from log_config import llm_log
+
+# Completions requested by each caller (agent or manager name), across all sessions.
+# These are attempts: AG2 consults the response cache below the middleware chain,
+# so requests answered from the cache are counted too. Installed inside the hedger
+# (see deadlines.py), count_calls also counts hedged duplicates.
+call_counts = Counter()
+
+
+class ManagerLLMCallError(RuntimeError):
+    """Raised when an agent that must stay offline tries to call the model."""
+
+
+class AgentClient:
+    """One agent's view of a (possibly shared) OpenAIWrapper with its own middleware chain."""
+
+    def __init__(self, client, agent, middlewares):
+        self._client = client
+
+        def call(params):
+            return client.create(**params)
+
+        for middleware in reversed(middlewares):
+            call = _link(middleware, call, agent)
+        self._call = call
+
+    def create(self, **params):
+        return self._call(params)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def _link(middleware, call_next, agent):
+    return lambda params: middleware(call_next, agent, params)
+
+
+def install_middleware(agent, *middlewares):
+    """Route agent.client.create through middlewares; no-op for agents without an LLM."""
+    client = getattr(agent, "client", None)
+    if client is None or not middlewares:
+        return
+    agent.client = AgentClient(client, agent, middlewares)
+
+
+def count_calls(counter):
+    """Middleware counting completion attempts, cache hits included, per caller into counter (and call_counts)."""
+    def middleware(call_next, agent, params):
+        counter[agent.name] += 1
+        call_counts[agent.name] += 1
+        return call_next(params)
+    return middleware
+
+
+def count_tokens(counter):
+    """Middleware adding each completion's prompt and completion tokens into counter."""
+    def middleware(call_next, agent, params):
+        response = call_next(params)
+        prompt, completion = _usage_counts(response)
+        counter["prompt_tokens"] += prompt
+        counter["completion_tokens"] += completion
+        return response
+    return middleware
+
+
+def refuse_calls(call_next, agent, params):
+    """Middleware for agents that must never reach the model, e.g. the manager."""
+    raise ManagerLLMCallError(f"{agent.name} attempted an LLM call while marked offline")
+
+
+def require_agent_selection(select):
+    """Wrap a speaker-selection callable so it can never fall back to LLM-based selection."""
+    def selection(last_speaker, group_chat):
+        speaker = select(last_speaker, group_chat)
+        if isinstance(speaker, str):
+            raise ManagerLLMCallError(f"Speaker selection fell back to {speaker!r}, which calls the model")
+        return speaker
+    return selection
+
+
+def _usage_counts(response):
+    usage = getattr(response, "usage", None)
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    return prompt, completion
+
+
+class UsageTracker:
+    """Per-agent call counts, token totals and latency across all sessions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._agents = defaultdict(lambda: {
+            "model": None, "calls": 0, "errors": 0, "prompt_tokens": 0,
+            "completion_tokens": 0, "latency_seconds": 0.0,
+        })
+
+    def __call__(self, call_next, agent, params):
+        start = time.perf_counter()
+        try:
+            response = call_next(params)
+        except Exception as e:
+            with self._lock:
+                self._agents[agent.name]["errors"] += 1
+            llm_log.warning("LLM call for %s failed: %s", agent.name, e, extra={"agent": agent.name})
+            raise
+        elapsed = time.perf_counter() - start
+        prompt, completion = _usage_counts(response)
+        with self._lock:
+            stats = self._agents[agent.name]
+            stats["model"] = getattr(response, "model", None) or stats["model"]
+            stats["calls"] += 1
+            stats["prompt_tokens"] += prompt
+            stats["completion_tokens"] += completion
+            stats["latency_seconds"] += elapsed
+        metrics.llm_latency.observe(elapsed, agent=agent.name)
+        metrics.llm_prompt_tokens.inc(prompt, agent=agent.name)
+        metrics.llm_completion_tokens.inc(completion, agent=agent.name)
+        llm_log.debug("LLM call for %s took %.2fs", agent.name, elapsed, extra={
+            "event": "llm_call", "agent": agent.name, "prompt_tokens": prompt, "completion_tokens": completion,
+        })
+        return response
+
+    def snapshot(self):
+        with self._lock:
+            agents = {name: dict(stats) for name, stats in self._agents.items()}
+        for stats in agents.values():
+            calls = stats["calls"]
+            stats["avg_latency_ms"] = round(1000 * stats.pop("latency_seconds") / calls, 1) if calls else 0
+        return agents
+
+
+usage_tracker = UsageTracker()
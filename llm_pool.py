@@ -0,0 +1,215 @@
+"""Process-wide LLM clients and request admission.
+
+Agents are rebuilt for every session, and each would otherwise build its own
+OpenAIWrapper (with a fresh SSL context) and open its own HTTP connections.
+pooled_agent() constructs an agent with llm_config=False, so AG2 creates no
+client, and then gives it the validated config and the one OpenAIWrapper for
+that config. All sessions in the process reuse that client's keep-alive
+connection pool, and building an agent costs no client setup at all.
+
+RateLimiter is a middleware (see llm_calls.py) that admits completions under
+requests-per-minute and tokens-per-minute token buckets and an adaptive
+concurrency limit. Waiting calls are granted to the session with the fewest
+calls in flight, so one busy classroom cannot starve the others. A 429
+halves the concurrency limit and the call is retried with backoff, while
+each success raises the limit again; sessions slow down instead of failing
+mid-discussion.
+"""
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter
+
+from autogen import LLMConfig, OpenAIWrapper
+
+from log_config import llm_log
+
+# Completion tokens assumed for a request until its usage is known.
+COMPLETION_ESTIMATE = 400
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _config_key(config):
+    if hasattr(config, "model_dump"):
+        config = config.model_dump()
+    return json.dumps(config, sort_keys=True, default=str)
+
+
+def shared_client(llm_config):
+    """The validated LLMConfig and process-wide OpenAIWrapper for llm_config; both are shared, not copied."""
+    key = _config_key(llm_config)
+    with _clients_lock:
+        pooled = _clients.get(key)
+        if pooled is None:
+            config = llm_config if isinstance(llm_config, LLMConfig) else LLMConfig(**llm_config)
+            pooled = _clients[key] = (config, OpenAIWrapper(**config))
+        return pooled
+
+
+def pooled_agent(agent_class, llm_config=False, **kwargs):
+    """Construct agent_class(**kwargs) using the shared client for llm_config instead of a new one."""
+    agent = agent_class(llm_config=False, **kwargs)
+    if llm_config:
+        agent.llm_config, agent.client = shared_client(llm_config)
+    return agent
+
+
+def shared_clients():
+    with _clients_lock:
+        return len(_clients)
+
+
+def is_rate_limited(error):
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def _retry_after(error, attempt):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return min(2 ** attempt, 30) + random.random()
+
+
+def estimate_tokens(params):
+    chars = sum(len(str(message.get("content") or "")) for message in params.get("messages", ()))
+    return chars // 4 + (params.get("max_tokens") or COMPLETION_ESTIMATE)
+
+
+class TokenBucket:
+    """Refills `per_minute` units a minute, holding at most one minute's worth."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self._stamp = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def wait_time(self, amount):
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.level -= amount
+
+
+class RateLimiter:
+    """Shared admission control for every LLM call made in this process."""
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0, max_concurrency=32, max_retries=5):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.rate_limited = 0
+        self.waited_seconds = 0.0
+        self._active = Counter()
+        self._waiting = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def for_session(self, session_id):
+        """Middleware that admits an agent's calls on behalf of session_id."""
+        def middleware(call_next, agent, params):
+            return self.call(session_id, call_next, params)
+        return middleware
+
+    def _next_waiter(self):
+        return min(self._waiting, key=lambda ticket: (self._active[ticket[0]], ticket[1]))
+
+    def _delay(self, tokens):
+        # Called with the lock held: seconds until the buckets allow this call.
+        return max(
+            self.requests.wait_time(1) if self.requests else 0.0,
+            self.tokens.wait_time(tokens) if self.tokens else 0.0,
+        )
+
+    def _acquire(self, session_id, tokens):
+        start = time.monotonic()
+        with self._cond:
+            ticket = (session_id, next(self._seq))
+            self._waiting.append(ticket)
+            try:
+                while True:
+                    if self._next_waiter() is ticket and self.in_flight < max(int(self.limit), 1):
+                        delay = self._delay(tokens)
+                        if delay <= 0:
+                            break
+                        self._cond.wait(delay)
+                    else:
+                        self._cond.wait(1.0)
+            finally:
+                self._waiting.remove(ticket)
+                self._cond.notify_all()
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(tokens)
+            self.in_flight += 1
+            self._active[session_id] += 1
+            self.waited_seconds += time.monotonic() - start
+
+    def _release(self, session_id, rate_limited=False):
+        with self._cond:
+            self.in_flight -= 1
+            self._active[session_id] -= 1
+            if self._active[session_id] <= 0:
+                del self._active[session_id]
+            if rate_limited:
+                self.rate_limited += 1
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def _settle(self, estimate, response):
+        usage = getattr(response, "usage", None)
+        actual = getattr(usage, "total_tokens", None)
+        if self.tokens and actual:
+            with self._cond:
+                self.tokens.take(actual - estimate)
+
+    def call(self, session_id, call_next, params):
+        estimate = estimate_tokens(params)
+        for attempt in range(self.max_retries + 1):
+            self._acquire(session_id, estimate)
+            try:
+                response = call_next(params)
+            except Exception as e:
+                limited = is_rate_limited(e)
+                self._release(session_id, rate_limited=limited)
+                if not limited or attempt == self.max_retries:
+                    raise
+                delay = _retry_after(e, attempt)
+                llm_log.info("Rate limited; retrying in %.1fs (attempt %d)", delay, attempt + 1,
+                             extra={"event": "rate_limited", "session": session_id})
+                time.sleep(delay)
+                continue
+            self._release(session_id)
+            self._settle(estimate, response)
+            return response
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "waiting": len(self._waiting),
+                "rate_limited": self.rate_limited,
+                "waited_seconds": round(self.waited_seconds, 1),
+                "shared_clients": shared_clients(),
+            }
@@ -0,0 +1,192 @@
+"""Load generator for the discussion WebSocket server.
+
+    python loadgen.py --clients 50 --ramp 10 --think uniform:2,8 --output load.json
+
+Opens --clients concurrent connections (started evenly over --ramp seconds)
+that each speak the browser's protocol: the command/start handshake, a ping
+every --ping-interval seconds, and a user_message reply, after a think time,
+whenever the server gives "You" the turn. Each client runs --discussions discussions
+in turn. The JSON report covers connect latency, time to the first agent
+message, per-turn latency (from the previous message, or our reply, to the
+next complete agent message) and time to first streamed token, with
+percentiles, plus error and rejection rates.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed, ConnectionClosedOK
+
+from client_frames import HUMAN_REPLY, frame_text, is_human_turn
+from routing import parse_structured_reply
+
+
+def parse_think(spec):
+    """Parse "fixed:S" or "uniform:LO,HI" (seconds)."""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v] or [0.0]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[-1])
+    raise ValueError(f"Unknown think-time distribution: {kind}")
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def at(q):
+        return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000, 1)
+
+    return {"count": len(ordered), "p50_ms": at(0.50), "p90_ms": at(0.90), "p99_ms": at(0.99), "max_ms": at(1.0)}
+
+
+class Results:
+    def __init__(self):
+        self.connect = []
+        self.first_message = []
+        self.turn = []
+        self.first_token = []
+        self.outcomes = Counter()
+        self.errors = Counter()
+        self.queued = 0
+
+    def report(self, elapsed, clients):
+        attempts = sum(self.outcomes.values())
+        failures = attempts - self.outcomes["completed"]
+        return {
+            "clients": clients,
+            "elapsed_seconds": round(elapsed, 1),
+            "discussions": dict(self.outcomes),
+            "error_rate": round(failures / attempts, 4) if attempts else 0.0,
+            "errors": dict(self.errors),
+            "queued_connections": self.queued,
+            "connect": percentiles(self.connect),
+            "time_to_first_agent_message": percentiles(self.first_message),
+            "turn_latency": percentiles(self.turn),
+            "time_to_first_token": percentiles(self.first_token),
+            "turns_per_second": round(len(self.turn) / elapsed, 2) if elapsed else 0.0,
+        }
+
+
+async def keepalive(ws, interval):
+    while True:
+        await asyncio.sleep(interval)
+        await ws.send(json.dumps({"type": "ping", "content": "keepalive"}))
+
+
+async def run_discussion(url, results, think, ping_interval, timeout):
+    """Run one discussion as the human and record its timings; returns the outcome."""
+    start = time.perf_counter()
+    try:
+        ws = await asyncio.wait_for(connect(url, max_size=None, open_timeout=timeout), timeout)
+    except Exception as e:
+        results.errors[f"connect: {type(e).__name__}"] += 1
+        return "connect_failed"
+    results.connect.append(time.perf_counter() - start)
+
+    pinger = asyncio.create_task(keepalive(ws, ping_interval))
+    previous = None
+    first = True
+    streaming = set()
+    mark = time.perf_counter()
+    try:
+        await ws.send(json.dumps({"type": "command", "content": "start"}))
+        while True:
+            raw = await asyncio.wait_for(ws.recv(), timeout)
+            try:
+                frame = json.loads(raw)
+            except json.JSONDecodeError:
+                continue
+            kind = frame.get("type")
+            now = time.perf_counter()
+
+            if is_human_turn(frame):
+                await asyncio.sleep(think())
+                await ws.send(json.dumps({"type": "user_message", "content": HUMAN_REPLY}))
+                mark = time.perf_counter()
+                continue
+            if kind == "error":
+                results.errors[f"server: {frame.get('code') or frame.get('message', '')[:60]}"] += 1
+                return "rejected" if frame.get("code") == 503 else "server_error"
+            elif kind == "system_message" and frame.get("position"):
+                results.queued += 1
+            elif kind == "agent_message_delta" and frame.get("id") not in streaming:
+                streaming.add(frame.get("id"))
+                results.first_token.append(now - mark)
+
+            text = frame_text(frame)
+            if not text:
+                continue
+            text, _ = parse_structured_reply(text)
+            if text == previous:
+                continue
+            previous = text
+            if first:
+                results.first_message.append(now - start)
+                first = False
+            else:
+                results.turn.append(now - mark)
+            mark = now
+    except asyncio.TimeoutError:
+        results.errors["timeout"] += 1
+        return "timeout"
+    except ConnectionClosedOK:
+        return "completed"
+    except ConnectionClosed as e:
+        code = e.rcvd.code if e.rcvd else None
+        if code == 1013:
+            return "rejected"
+        results.errors[f"closed: {code}"] += 1
+        return "disconnected"
+    except Exception as e:
+        results.errors[type(e).__name__] += 1
+        return "client_error"
+    finally:
+        pinger.cancel()
+        await ws.close()
+
+
+async def client(url, results, args, think, delay):
+    await asyncio.sleep(delay)
+    for _ in range(args.discussions):
+        outcome = await run_discussion(url, results, think, args.ping_interval, args.timeout)
+        results.outcomes[outcome] += 1
+
+
+async def run(args):
+    results = Results()
+    think = parse_think(args.think)
+    start = time.perf_counter()
+    step = args.ramp / args.clients if args.clients else 0
+    await asyncio.gather(*(client(args.url, results, args, think, i * step) for i in range(args.clients)))
+    return results.report(time.perf_counter() - start, args.clients)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent classrooms against discussion.py")
+    parser.add_argument("--url", default="ws://127.0.0.1:8080")
+    parser.add_argument("--clients", type=int, default=10, help="concurrent WebSocket clients")
+    parser.add_argument("--discussions", type=int, default=1, help="discussions run by each client in turn")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds over which clients are started")
+    parser.add_argument("--think", default="uniform:2,8", help="human think time: fixed:S or uniform:LO,HI")
+    parser.add_argument("--ping-interval", type=float, default=30.0)
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for any single frame")
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(run(args)), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
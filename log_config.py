@@ -0,0 +1,139 @@
+"""Structured logging written off the discussion thread.
+
+configure_logging() installs one handler on the root logger. That handler
+only puts records on a queue, and a QueueListener thread formats them (JSON
+lines by default) and writes them out. Nothing formats or blocks on I/O on
+the thread that drives a discussion. Records keep their msg and args
+unformatted until the listener renders them, so callers should log with
+%-style arguments, and pass values that will not change afterwards, rather
+than f-strings:
+
+    io_log.debug("Sent message from %s: %.50s", agent_name, content, extra={"event": "send"})
+
+Each subsystem has its own logger and can have its own level: classroom.routing
+(speaker selection), classroom.io (WebSocket traffic) and classroom.llm (model
+calls). General lifecycle messages go to "classroom". High-volume records carry
+an "event" and can be sampled per event before they are queued.
+
+    LOG_LEVEL=INFO                              root level
+    LOG_LEVELS=routing=DEBUG,io=WARNING         per-subsystem levels
+    LOG_SAMPLE=send=0.01,ping=0                 share of each event that is kept
+    LOG_FORMAT=json                             or "text"
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+log = logging.getLogger("classroom")
+routing_log = logging.getLogger("classroom.routing")
+io_log = logging.getLogger("classroom.io")
+llm_log = logging.getLogger("classroom.llm")
+
+# Attributes every LogRecord has; anything else came from extra= and is emitted as a field.
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with extra= fields at the top level."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread."""
+
+    def prepare(self, record):
+        if record.exc_info:
+            # Tracebacks hold frames that must not outlive the caller, so render them now.
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SampleFilter(logging.Filter):
+    """Keep only a share of the records for each sampled "event"."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(getattr(record, "event", None))
+        return rate is None or rate >= 1 or random.random() < rate
+
+
+def parse_pairs(spec, convert):
+    """Parse "a=1,b=2" into {"a": convert("1"), "b": convert("2")}."""
+    pairs = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        key, _, value = item.partition("=")
+        pairs[key.strip()] = convert(value.strip())
+    return pairs
+
+
+def configure_logging(level=None, levels=None, sample=None, fmt=None, stream=None):
+    """Route all logging through a queue to a background writer; arguments override the LOG_* variables."""
+    global _listener
+    if _listener:
+        _listener.stop()
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    levels = levels if levels is not None else parse_pairs(os.getenv("LOG_LEVELS"), str.upper)
+    sample = sample if sample is not None else parse_pairs(os.getenv("LOG_SAMPLE"), float)
+    fmt = fmt or os.getenv("LOG_FORMAT", "json")
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    if fmt == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        formatter.converter = time.localtime
+        output.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    handler = DeferredQueueHandler(records)
+    if sample:
+        handler.addFilter(SampleFilter(sample))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name, subsystem_level in levels.items():
+        logging.getLogger(f"classroom.{name}").setLevel(subsystem_level)
+
+    _listener = QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
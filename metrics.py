@@ -0,0 +1,161 @@
+"""Minimal Prometheus metrics registry.
+
+Counters, gauges and histograms with labels, rendered in the Prometheus text
+exposition format by render(). A metric can also read its samples from a
+callback at render time (set_function), which is how existing counters such
+as routing_stats are exported without being duplicated.
+
+Metrics are per process. With WORKERS > 0, every worker answers /metrics on
+its own WebSocket port, and each one should be scraped.
+"""
+import math
+import threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, math.inf)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._function = None
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def set_function(self, function):
+        """Read samples from function() at render time: a number, or {label values tuple: number}."""
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            value = self._function()
+            if not isinstance(value, dict):
+                return [(self.name, (), value, ())]
+            return [(self.name, key if isinstance(key, tuple) else (key,), v, ()) for key, v in value.items()]
+        with self._lock:
+            if not self._values and not self.labelnames:
+                return [(self.name, (), 0, ())]
+            return [(self.name, key, value, ()) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for name, key, value, extra in self.samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets) if buckets[-1] == math.inf else tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        out = []
+        for key, counts, total, count in values:
+            for bound, bucket_count in zip(self.buckets, counts):
+                out.append((f"{self.name}_bucket", key, bucket_count, (("le", _format_value(bound)),)))
+            out.append((f"{self.name}_sum", key, total, ()))
+            out.append((f"{self.name}_count", key, count, ()))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, *args, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Metrics recorded from more than one module.
+llm_latency = REGISTRY.histogram(
+    "classroom_llm_request_seconds", "LLM completion latency by agent.", ["agent"])
+llm_prompt_tokens = REGISTRY.counter(
+    "classroom_llm_prompt_tokens_total", "Prompt tokens sent to the model by agent.", ["agent"])
+llm_completion_tokens = REGISTRY.counter(
+    "classroom_llm_completion_tokens_total", "Completion tokens received from the model by agent.", ["agent"])
+websocket_send_failures = REGISTRY.counter(
+    "classroom_websocket_send_failures_total", "Frames that could not be delivered to a client.")
+turns = REGISTRY.counter(
+    "classroom_turns_total", "Speaker turns taken across all discussions.")
+human_input_wait = REGISTRY.histogram(
+    "classroom_human_input_wait_seconds", "Time spent waiting for the human participant to answer.",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, math.inf))
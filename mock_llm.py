@@ -0,0 +1,211 @@
+"""Local stand-in for the OpenAI chat-completions API.
+
+Serves POST /v1/chat/completions, with and without streaming, so the
+classroom can run and be load-tested with no network or API key. Point a
+CONFIG_LIST entry at it (see CONFIG_LIST.mock.json):
+
+    python mock_llm.py --port 8400 --latency lognormal:1.2,0.4 --error-rate 0.02
+
+Replies come from a script file when one is given, otherwise from
+templates. Either way they end by calling on a classmate, the Teacher or
+"You", in the call-out style the speaker router recognises. When the request
+carries a JSON-schema response_format (STRUCTURED_ROUTING), the reply is
+the {"reply", "next_speaker"} object instead. Latency is drawn from a
+configurable distribution and spent before the first token. Streamed
+replies then pause --token-delay between tokens. A share of requests can be
+failed with a chosen HTTP status.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+SPEAKER_PATTERN = re.compile(r"\bYou are (?:\*\*)?([A-Z][a-z]+)")
+ROSTER_PATTERN = re.compile(r"\b(?:students|classmates|call on)[^:\n]*:\W*([A-Z][\w ,]+)")
+
+OPENINGS = [
+    "That's a really interesting way to look at it.",
+    "I think the key idea here is how the parts interact over time.",
+    "I'm not completely sure, but it might have to do with energy and gradients.",
+    "Let's build on what was just said.",
+    "I had a slightly different picture in my head at first.",
+    "Good point, and it connects to what we saw earlier.",
+]
+BODIES = [
+    "If we think about it step by step, the process only works when each stage supports the next one.",
+    "One thing that confuses me is why the effect seems so much stronger at larger scales.",
+    "A real-world example might help, like how water moves through a garden hose versus a sponge.",
+    "I wonder whether we're mixing up the cause with the result here.",
+    "Maybe the simplest explanation is that it depends on the size of the system.",
+]
+CALLOUTS = [
+    "{name}, what do you think?",
+    "What do you think, {name}?",
+    "{name}, do you agree with that?",
+    "I'd love to hear {name}'s thoughts on this.",
+    "{name}, could you add to that?",
+]
+
+app = FastAPI()
+settings = argparse.Namespace(latency=("fixed", [0.0]), token_delay=0.0, error_rate=0.0,
+                              error_status=500, script=None, seed=None)
+_script_cursor = itertools.count()
+
+
+def parse_latency(spec):
+    """Parse "fixed:S", "uniform:LO,HI", "normal:MEAN,SD" or "lognormal:MEDIAN,SIGMA"."""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v] or [0.0]
+    if kind not in ("fixed", "uniform", "normal", "lognormal"):
+        raise ValueError(f"Unknown latency distribution: {kind}")
+    return kind, values
+
+
+def sample_latency():
+    kind, values = settings.latency
+    if kind == "uniform":
+        return random.uniform(values[0], values[1] if len(values) > 1 else values[0])
+    if kind == "normal":
+        return max(0.0, random.gauss(values[0], values[1] if len(values) > 1 else 0.0))
+    if kind == "lognormal":
+        return random.lognormvariate(0, values[1] if len(values) > 1 else 0.5) * values[0]
+    return values[0]
+
+
+def count_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def roster(messages, speaker):
+    """Names the speaker could call on, gathered from the conversation."""
+    names = {"Teacher", "You"}
+    for message in messages:
+        if message.get("name"):
+            names.add(message["name"])
+        for match in re.findall(ROSTER_PATTERN, str(message.get("content", ""))):
+            names.update(n.strip() for n in match.split(",") if n.strip()[:1].isupper())
+    names.discard(speaker)
+    names.discard("chat_manager")
+    return sorted(n for n in names if n.isalpha())
+
+
+def compose_reply(body):
+    messages = body.get("messages", [])
+    system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+    match = SPEAKER_PATTERN.search(system)
+    speaker = match.group(1) if match else ("Teacher" if "teacher" in system.lower() else None)
+
+    schema = (body.get("response_format") or {}).get("json_schema", {}).get("schema", {})
+    candidates = schema.get("properties", {}).get("next_speaker", {}).get("enum") or roster(messages, speaker)
+    callee = random.choice(candidates or ["Teacher"])
+
+    if settings.script:
+        text = settings.script[next(_script_cursor) % len(settings.script)]
+        text = text.format(name=callee, speaker=speaker or "")
+    else:
+        callouts = [c for c in CALLOUTS if callee != "You" or "'s" not in c]
+        text = " ".join([random.choice(OPENINGS), random.choice(BODIES), random.choice(callouts).format(name=callee)])
+
+    if schema:
+        return json.dumps({"reply": text, "next_speaker": callee})
+    return text
+
+
+def usage(body, text):
+    prompt = sum(count_tokens(str(m.get("content", ""))) for m in body.get("messages", []))
+    completion = count_tokens(text)
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+def completion(body, text):
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": "stop",
+        }],
+        "usage": usage(body, text),
+    }
+
+
+async def stream(body, text, first_token_delay):
+    chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+    base = {"id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()),
+            "model": body.get("model", "mock")}
+    pieces = re.findall(r"\S+\s*", text)
+    per_token = settings.token_delay
+
+    await asyncio.sleep(first_token_delay)
+    yield "data: " + json.dumps({**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""},
+                                                      "finish_reason": None}]}) + "\n\n"
+    for piece in pieces:
+        if per_token:
+            await asyncio.sleep(per_token)
+        yield "data: " + json.dumps({**base, "choices": [{"index": 0, "delta": {"content": piece},
+                                                          "finish_reason": None}]}) + "\n\n"
+    yield "data: " + json.dumps({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}) + "\n\n"
+    if (body.get("stream_options") or {}).get("include_usage"):
+        yield "data: " + json.dumps({**base, "choices": [], "usage": usage(body, text)}) + "\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    latency = sample_latency()
+
+    if random.random() < settings.error_rate:
+        await asyncio.sleep(latency / 4)
+        headers = {"retry-after": "1"} if settings.error_status == 429 else {}
+        return JSONResponse(status_code=settings.error_status, headers=headers, content={
+            "error": {"message": "Injected failure from mock_llm", "type": "mock_error", "code": settings.error_status}
+        })
+
+    text = compose_reply(body)
+    if body.get("stream"):
+        return StreamingResponse(stream(body, text, latency), media_type="text/event-stream")
+    await asyncio.sleep(latency)
+    return completion(body, text)
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock_llm"}]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8400)
+    parser.add_argument("--latency", type=parse_latency, default=("fixed", [0.0]),
+                        help="fixed:S, uniform:LO,HI, normal:MEAN,SD or lognormal:MEDIAN,SIGMA (seconds)")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests to fail")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status for injected failures")
+    parser.add_argument("--script", help="JSON list of replies, used in order; may contain {name} and {speaker}")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    if args.script:
+        with open(args.script, "r") as f:
+            args.script = json.load(f)
+    if args.seed is not None:
+        random.seed(args.seed)
+    vars(settings).update(vars(args))
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
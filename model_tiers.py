@@ -0,0 +1,44 @@
+"""Per-role and per-agent model selection.
+
+Entries in CONFIG_LIST.json may carry "tags": an agent name ("Alvin") or a
+role ("teacher", "student", "manager"). An agent is given the entries tagged
+with its name, else those tagged with its role, else the untagged ones. A
+student entry in students.json can pin a "model" directly and set its own
+"max_tokens" and "temperature"; these win over CONFIG_LIST.json.
+"""
+
+OVERRIDES = ("max_tokens", "temperature")
+
+
+def select_configs(config_list, role, name=None):
+    """Config entries for an agent, most specific tag first."""
+    for tag in (name, role):
+        tagged = [config for config in config_list if tag and tag in config.get("tags", ())]
+        if tagged:
+            return tagged
+    untagged = [config for config in config_list if not config.get("tags")]
+    return untagged or list(config_list)
+
+
+def agent_llm_config(llm_config, role, entry=None):
+    """llm_config for one agent, derived from the shared one.
+
+    entry is the agent's students.json record (or any dict with "name" and
+    optional "model", "max_tokens", "temperature").
+    """
+    entry = entry or {}
+    config_list = llm_config["config_list"]
+    model = entry.get("model")
+    if model:
+        selected = [config for config in config_list if config.get("model") == model]
+        if not selected:
+            base = select_configs(config_list, role, entry.get("name"))[0]
+            selected = [{**base, "model": model}]
+    else:
+        selected = select_configs(config_list, role, entry.get("name"))
+
+    agent_config = {**llm_config, "config_list": selected}
+    for key in OVERRIDES:
+        if entry.get(key) is not None:
+            agent_config[key] = entry[key]
+    return agent_config
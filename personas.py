@@ -0,0 +1,79 @@
+"""Immutable persona prompts for classroom agents.
+
+Prompts are rendered once from students.json and the roster when the server
+starts. Sessions only read them, so every connection sends the model exactly
+the same prompt and no connection can change what another one sees.
+"""
+from collections import namedtuple
+from types import MappingProxyType
+
+Persona = namedtuple(
+    "Persona", ["name", "system_message", "description", "llm_config", "max_context_tokens"], defaults=(None,)
+)
+
+
+def _freeze(config):
+    # Nested dicts stay shared; agents are handed a fresh top-level copy.
+    return MappingProxyType(dict(config)) if isinstance(config, dict) else config
+
+
+class PersonaStore:
+    """Pre-rendered Teacher and student personas for one roster."""
+
+    def __init__(self, teacher, students):
+        self.teacher = teacher
+        self.students = tuple(students)
+        self.by_name = MappingProxyType({p.name: p for p in (teacher, *self.students)})
+
+    @classmethod
+    def build(cls, student_data, teacher_prompt, teacher_description, student_guidelines, reply_config,
+              max_context_tokens=None):
+        """Render every persona once.
+
+        teacher_prompt is formatted with {students}; student_guidelines with
+        {name} and {classmates}. reply_config(candidates) returns the extra
+        system message and llm_config for an agent that may call on candidates;
+        it is also given the agent's role and students.json entry so models can
+        be assigned per agent. max_context_tokens is the default history ceiling; a student entry can
+        override it with its own "max_context_tokens".
+        """
+        names = [s["name"] for s in student_data]
+
+        teacher_format, teacher_llm_config = reply_config(names + ["You"], "teacher", {"name": "Teacher"})
+        teacher = Persona(
+            name="Teacher",
+            system_message=teacher_prompt.format(students=", ".join(names)) + teacher_format,
+            description=teacher_description,
+            llm_config=_freeze(teacher_llm_config),
+            max_context_tokens=max_context_tokens,
+        )
+
+        students = []
+        for student in student_data:
+            classmates = [name for name in names if name != student["name"]]
+            student_format, student_llm_config = reply_config(classmates + ["Teacher", "You"], "student", student)
+            guidelines = student_guidelines.format(name=student["name"], classmates=", ".join(classmates))
+            students.append(Persona(
+                name=student["name"],
+                system_message=student["system_message"] + guidelines + student_format,
+                description=student["description"],
+                llm_config=_freeze(student_llm_config),
+                max_context_tokens=student.get("max_context_tokens", max_context_tokens),
+            ))
+
+        return cls(teacher, students)
+
+    def prompt_chars(self):
+        """Total characters across all persona system messages."""
+        return sum(len(p.system_message) for p in self.by_name.values())
+
+
+def agent_kwargs(persona):
+    """Keyword arguments for a ConversableAgent playing this persona."""
+    llm_config = persona.llm_config
+    return {
+        "name": persona.name,
+        "system_message": persona.system_message,
+        "description": persona.description,
+        "llm_config": dict(llm_config) if isinstance(llm_config, MappingProxyType) else llm_config,
+    }
@@ -0,0 +1,149 @@
+"""Speaker routing for classroom group chats.
+
+A SpeakerRouter is compiled once per roster and answers "who was called on?"
+for a message in a single pass over its tail, without rebuilding or
+recompiling any patterns per turn.
+"""
+import json
+import re
+from collections import Counter
+from functools import lru_cache
+
+# Call-outs live at the end of a message; anything further back than this is
+# never used to pick the next speaker.
+TAIL_CHARS = 1500
+
+SENTENCE_SPLIT = re.compile(r'[.!?]\s+')
+
+# Call-out phrases, in priority order. "{agent}" is replaced with a capturing
+# alternation over the roster.
+CALLOUT_TEMPLATES = (
+    r"(?:^|\W){agent}(?:,|\.|\?|!|\s).*?\?$",
+    r"(?:^|\W){agent}(?:,|\.|\?|!|\s).*thoughts",
+    r"(?:^|\W){agent}(?:,|\.|\?|!|\s).*think",
+    r"Let's hear from\s+{agent}",
+    r"{agent},\s+would you",
+    r"What (?:do|about|are) (?:you|your).*,\s+{agent}",
+    r"{agent},\s+what",
+    r"What do you think,?\s+{agent}",
+    r"Do you (?:have|think).*,?\s+{agent}",
+    r"How about you,?\s+{agent}",
+    r"{agent},\s+(?:do|can|could) you",
+    r"(?:Do|Can|Could|Would) {agent}",
+    r"I'd like to hear from\s+{agent}",
+    r"{agent}\s+(?:should|could|would) (?:you|your)",
+    r"hear (?:your|) thoughts,?\s+{agent}",
+    r"ask\s+{agent}",
+)
+
+RULE_STRUCTURED = "structured"
+RULE_STRUCTURED_INVALID = "structured_invalid"
+RULE_MENTION = "tail_mention"
+RULE_CALLOUT = "callout_pattern"
+RULE_FALLBACK = "fallback"
+# The Teacher always answers a session's opening prompt; that turn is not routed.
+RULE_OPENING = "opening"
+
+# Routing decisions by rule for this process. RULE_FALLBACK counts turns where
+# nobody was identifiably called on, i.e. likely misroutes.
+routing_stats = Counter()
+
+STRUCTURED_REPLY_INSTRUCTIONS = """
+            **🧭 RESPONSE FORMAT**
+            Respond ONLY with a JSON object of the form {{"reply": "<your message>", "next_speaker": "<name>"}}.
+            - "reply" is exactly what you want to say to the group, including your call-out.
+            - "next_speaker" is the participant you called on, chosen from: {names}.
+            """
+
+
+class SpeakerRouter:
+    """Finds the participant called on at the end of a message."""
+
+    def __init__(self, agent_names):
+        self.names = frozenset(agent_names)
+        # Longest names first so that one name never shadows a longer one.
+        alternation = "|".join(re.escape(name) for name in sorted(self.names, key=len, reverse=True))
+        agent = f"({alternation})"
+        self._any_name = re.compile(alternation)
+        self._mention = re.compile(rf"\b(?:{alternation})\b")
+        self._callouts = tuple(
+            re.compile(template.format(agent=agent), re.IGNORECASE)
+            for template in CALLOUT_TEMPLATES
+        )
+
+    def route(self, content):
+        """Return (name, rule) for the called participant, or (None, "fallback")."""
+        if not content or not self.names:
+            return None, RULE_FALLBACK
+
+        window = content[-TAIL_CHARS:]
+        sentences = [s.strip() for s in SENTENCE_SPLIT.split(window) if s.strip()]
+        # The first piece of a truncated window may be a partial sentence, so
+        # only trust the window if it holds more than the two we look at.
+        if len(window) < len(content) and len(sentences) < 3:
+            sentences = [s.strip() for s in SENTENCE_SPLIT.split(content) if s.strip()]
+
+        for sentence in sentences[-2:]:
+            match = self._mention.search(sentence)
+            if match:
+                return match.group(0), RULE_MENTION
+
+        # Every call-out pattern needs an exact roster name to count, so a
+        # window without one can skip the pattern scan entirely.
+        if not self._any_name.search(window):
+            return None, RULE_FALLBACK
+
+        for pattern in self._callouts:
+            for match in pattern.findall(window):
+                if isinstance(match, tuple):
+                    match = match[0]
+                if match in self.names:
+                    return match, RULE_CALLOUT
+
+        return None, RULE_FALLBACK
+
+    def find(self, content, default=None):
+        """Return the called participant's name, or default."""
+        name, _ = self.route(content)
+        return name if name is not None else default
+
+
+@lru_cache(maxsize=256)
+def _router_for(names):
+    return SpeakerRouter(names)
+
+
+def get_router(agent_names):
+    """Return the shared SpeakerRouter for a roster, compiling it on first use."""
+    return _router_for(frozenset(agent_names))
+
+
+def structured_reply_schema(candidates):
+    """Return the JSON schema for a structured reply that may call on candidates."""
+    return {
+        "type": "object",
+        "properties": {
+            "reply": {"type": "string"},
+            "next_speaker": {"type": "string", "enum": sorted(candidates)},
+        },
+        "required": ["reply", "next_speaker"],
+        "additionalProperties": False,
+    }
+
+
+def parse_structured_reply(content):
+    """Split a structured reply into (text, declared next speaker).
+
+    Anything that is not a structured payload is returned unchanged with no
+    declared speaker, so callers can fall back to SpeakerRouter.
+    """
+    if not isinstance(content, str) or not content.lstrip().startswith("{"):
+        return content, None
+    try:
+        payload = json.loads(content)
+    except ValueError:
+        return content, None
+    if not isinstance(payload, dict) or "reply" not in payload:
+        return content, None
+    next_speaker = payload.get("next_speaker")
+    return str(payload.get("reply") or ""), next_speaker if isinstance(next_speaker, str) else None
@@ -0,0 +1,56 @@
+"""Search archived discussions in the transcript store.
+
+    python search_transcripts.py "bulk flow" diffusion --agent Bianca
+    python search_transcripts.py 'flux* NEAR(solver problem)' --raw --json
+
+Every word and "quoted phrase" must appear in a message; --raw passes the
+query to SQLite FTS5 unchanged. Each hit prints the session id, turn,
+speaker and a snippet with the matches in [brackets]. Pass a session id to
+GET /transcripts/{session_id} for the full discussion.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from transcripts import TranscriptReader
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Full-text search over stored discussion transcripts")
+    parser.add_argument("query", nargs="+", help='words and "quoted phrases" that must all appear')
+    parser.add_argument("--db", default=os.getenv("TRANSCRIPT_PATH"), help="transcript database (TRANSCRIPT_PATH)")
+    parser.add_argument("--agent", help="only messages by this speaker")
+    parser.add_argument("--session", help="only messages in this session")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--raw", action="store_true", help="use the query as FTS5 syntax")
+    parser.add_argument("--json", action="store_true", help="print hits as JSON")
+    args = parser.parse_args()
+
+    if not args.db or not os.path.exists(args.db):
+        sys.exit("No transcript database: set TRANSCRIPT_PATH or pass --db")
+
+    text = " ".join(args.query) if args.raw else " ".join(
+        f'"{term}"' if " " in term else term for term in args.query)
+    try:
+        hits = TranscriptReader(args.db).search(text, args.agent, args.session, args.limit, args.raw)
+    except sqlite3.OperationalError as e:
+        sys.exit(f"Invalid search query: {e}")
+
+    if args.json:
+        print(json.dumps(hits, indent=2))
+        return
+    for hit in hits:
+        when = datetime.fromtimestamp(hit["ts"]).strftime("%Y-%m-%d %H:%M")
+        print(f"{hit['session_id']}  turn {hit['turn']}  {when}  {hit['agent']}: {hit['snippet']}")
+    if not hits:
+        print("No matches.")
+
+
+if __name__ == "__main__":
+    main()
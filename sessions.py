@@ -0,0 +1,180 @@
+"""Registry of live classroom sessions.
+
+Every WebSocket connection gets its own Session holding that classroom's
+agents, GroupChat and iostream, so concurrent discussions never share state.
+When every classroom is in use, new connections wait in a bounded FIFO
+admission queue and are handed the next free slot in arrival order.
+"""
+import asyncio
+import threading
+import time
+import uuid
+from collections import Counter, deque
+
+# Initial guess for how long a discussion lasts, refined as sessions finish.
+DEFAULT_SESSION_SECONDS = 600.0
+
+
+class Session:
+    """One classroom discussion bound to a client connection."""
+
+    def __init__(self, iostream):
+        self.id = uuid.uuid4().hex
+        self.iostream = iostream
+        self.state = "starting"
+        self.created_at = time.time()
+        self.turns = 0
+        self.current_speaker = None
+        self.agents = []
+        self.group_chat = None
+        self.llm_calls = Counter()
+        # Tracing state (see tracing.py): the root span, the current turn's
+        # span and when the current phase began.
+        self.trace = None
+        self.turn_span = None
+        self.phase_mark = None
+        # The current turn, for its transcript row: when the speaker was chosen,
+        # by which routing rule, and the tokens its LLM calls have used.
+        self.turn_started = None
+        self.route_rule = None
+        self.turn_tokens = Counter()
+
+    def snapshot(self):
+        """Return a JSON-serialisable view of the session for /status."""
+        return {
+            "id": self.id,
+            "state": self.state,
+            "turns": self.turns,
+            "current_speaker": self.current_speaker,
+            "agents": [agent.name for agent in self.agents],
+            "llm_call_attempts": dict(self.llm_calls),
+            "age_seconds": round(time.time() - self.created_at, 1),
+        }
+
+
+class _Ticket:
+    """A connection waiting in the admission queue."""
+
+    def __init__(self, iostream, loop):
+        self.iostream = iostream
+        self.loop = loop
+        self.future = loop.create_future()
+
+
+class SessionRegistry:
+    """Thread-safe map of session id to Session with a concurrency limit."""
+
+    def __init__(self, max_sessions, queue_depth=0):
+        self.max_sessions = max_sessions
+        self.queue_depth = queue_depth
+        self.rejected = 0
+        self._sessions = {}
+        self._queue = deque()
+        self._avg_duration = DEFAULT_SESSION_SECONDS
+        self._lock = threading.Lock()
+
+    def _create(self, iostream):
+        session = Session(iostream)
+        self._sessions[session.id] = session
+        return session
+
+    def open(self, iostream):
+        """Register a new session, or return None when at capacity."""
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions or self._queue:
+                self.rejected += 1
+                return None
+            return self._create(iostream)
+
+    async def admit(self, iostream, on_wait=None, update_interval=5.0):
+        """Open a session, waiting in the admission queue while at capacity.
+
+        Returns None straight away when the queue is already full. While the
+        connection waits, on_wait(position, estimated_wait_seconds) is called
+        every update_interval seconds; if it raises, the ticket is withdrawn.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if len(self._sessions) < self.max_sessions and not self._queue:
+                return self._create(iostream)
+            if len(self._queue) >= self.queue_depth:
+                self.rejected += 1
+                return None
+            ticket = _Ticket(iostream, loop)
+            self._queue.append(ticket)
+
+        try:
+            while True:
+                position, estimated_wait = self.queue_position(ticket)
+                if position and on_wait:
+                    on_wait(position, estimated_wait)
+                try:
+                    return await asyncio.wait_for(asyncio.shield(ticket.future), update_interval)
+                except asyncio.TimeoutError:
+                    continue
+        except BaseException:
+            with self._lock:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+            # _hand_off may already have scheduled a session for this ticket; once the
+            # future is cancelled, _deliver closes that session instead.
+            if not ticket.future.cancel() and not ticket.future.cancelled():
+                self.close(ticket.future.result().id)
+            raise
+
+    def queue_position(self, ticket):
+        """Return (1-based position, estimated wait in seconds) for a queued ticket."""
+        with self._lock:
+            try:
+                position = self._queue.index(ticket) + 1
+            except ValueError:
+                return 0, 0.0
+            return position, position * self._avg_duration / max(self.max_sessions, 1)
+
+    def close(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session:
+                duration = time.time() - session.created_at
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+            self._hand_off()
+        return session
+
+    def _hand_off(self):
+        # Called with the lock held: give freed slots to the oldest waiters.
+        while self._queue and len(self._sessions) < self.max_sessions:
+            ticket = self._queue.popleft()
+            session = self._create(ticket.iostream)
+            ticket.loop.call_soon_threadsafe(self._deliver, ticket, session)
+
+    def _deliver(self, ticket, session):
+        if ticket.future.done():
+            self.close(session.id)
+        else:
+            ticket.future.set_result(session)
+
+    def adopt(self, session, replacement):
+        """Hand an admitted session's slot over to a prepared replacement."""
+        with self._lock:
+            self._sessions.pop(session.id, None)
+            replacement.created_at = time.time()
+            self._sessions[replacement.id] = replacement
+        return replacement
+
+    def get(self, session_id):
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    @property
+    def queued(self):
+        with self._lock:
+            return len(self._queue)
+
+    def snapshot(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return [session.snapshot() for session in sessions]
@@ -0,0 +1,251 @@
+"""Process-pool sharding of classroom sessions.
+
+The front process owns the public WebSocket port and proxies each new
+connection to one of N worker processes, each running its own discussion
+server on a private port. A connection stays on the worker that accepted it,
+and clients that present a session key are routed back to the same worker,
+which is how a client resuming after a dropped connection finds its
+discussion. A key is kept while it has a connection and for sticky_ttl
+seconds (the resume grace period) after its last one closes.
+
+Workers are recycled by draining: they stop receiving new sessions and are
+only restarted once they have no proxied connections and report no open
+sessions, including discussions still waiting for a client to resume.
+"""
+import asyncio
+import functools
+import json
+import multiprocessing
+import sys
+import time
+import urllib.request
+
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+
+from log_config import log
+
+SUPERVISE_INTERVAL = 1.0
+CONNECT_RETRIES = 20
+
+
+def run_worker(host, port):
+    """Process entry point: serve discussions on a private port until killed."""
+    # Started as `python discussion.py`, spawn has already imported it here as
+    # __mp_main__; importing it again would build its module state a second time.
+    module = sys.modules.get("__mp_main__")
+    if not hasattr(module, "serve_sessions"):
+        import discussion as module
+    asyncio.run(module.serve_sessions(host, port))
+
+
+def session_key(frame):
+    """Return the sticky routing key a client sent in its first frame, if any."""
+    try:
+        parsed = json.loads(frame)
+    except (TypeError, ValueError):
+        return None
+    if isinstance(parsed, dict):
+        return parsed.get("session")
+    return None
+
+
+class Worker:
+    """One discussion server process and the sessions routed to it."""
+
+    def __init__(self, index, host, port):
+        self.index = index
+        self.host = host
+        self.port = port
+        self.process = None
+        self.active = 0
+        self.served = 0
+        self.draining = False
+        self.started_at = None
+
+    @property
+    def uri(self):
+        return f"ws://{self.host}:{self.port}"
+
+    def start(self, context):
+        self.process = context.Process(target=run_worker, args=(self.host, self.port), daemon=True)
+        self.process.start()
+        self.active = 0
+        self.served = 0
+        self.draining = False
+        self.started_at = time.time()
+
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def snapshot(self):
+        return {
+            "index": self.index,
+            "pid": self.process.pid if self.process else None,
+            "port": self.port,
+            "state": "draining" if self.draining else "running" if self.alive() else "stopped",
+            "sessions": self.active,
+            "served": self.served,
+            "uptime_seconds": round(time.time() - self.started_at, 1) if self.started_at else 0,
+        }
+
+
+class WorkerPool:
+    """Spawns worker processes and routes WebSocket sessions across them."""
+
+    def __init__(self, num_workers, base_port, host="127.0.0.1", max_sessions_per_worker=0, sticky_ttl=0.0):
+        self.host = host
+        self.max_sessions_per_worker = max_sessions_per_worker
+        self.sticky_ttl = sticky_ttl
+        self.workers = [Worker(i, host, base_port + i) for i in range(num_workers)]
+        self._context = multiprocessing.get_context("spawn")
+        # Session key -> [worker index, open connections, monotonic time the key expires once idle].
+        self._sticky = {}
+        self._supervisor = None
+
+    async def start(self):
+        for worker in self.workers:
+            worker.start(self._context)
+            log.info("[Pool] Started worker %d (pid %d) on port %d", worker.index, worker.process.pid, worker.port)
+        self._supervisor = asyncio.create_task(self._supervise())
+
+    async def stop(self):
+        if self._supervisor:
+            self._supervisor.cancel()
+        for worker in self.workers:
+            await self._stop_process(worker)
+
+    def recycle(self, index):
+        """Drain a worker: route no new sessions to it and restart it once idle."""
+        self.workers[index].draining = True
+
+    def snapshot(self):
+        return [worker.snapshot() for worker in self.workers]
+
+    def route(self, key=None):
+        """Pick the worker for a session, honouring an existing sticky key."""
+        if key is not None and key in self._sticky:
+            worker = self.workers[self._sticky[key][0]]
+            if worker.alive():
+                return worker
+        candidates = [w for w in self.workers if w.alive() and not w.draining]
+        if not candidates:
+            return None
+        worker = min(candidates, key=lambda w: w.active)
+        if key is not None:
+            self._sticky[key] = [worker.index, 0, None]
+        return worker
+
+    def _hold(self, key):
+        if key in self._sticky:
+            self._sticky[key][1] += 1
+
+    def _release(self, key):
+        entry = self._sticky.get(key)
+        if entry:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                entry[2] = time.monotonic() + self.sticky_ttl
+
+    def _prune_sticky(self):
+        now = time.monotonic()
+        self._sticky = {
+            key: entry for key, entry in self._sticky.items()
+            if entry[1] > 0 or entry[2] is None or entry[2] > now
+        }
+
+    async def proxy(self, client):
+        """WebSocket handler for the front port: relay one session to its worker."""
+        try:
+            first_frame = await client.recv()
+        except ConnectionClosed:
+            return
+
+        key = session_key(first_frame)
+        worker = self.route(key)
+        if worker is None:
+            # Same rejection as discussion.py's single-process admission path.
+            await client.send(json.dumps({
+                "type": "error",
+                "code": 503,
+                "message": "All classrooms are currently busy. Please try again shortly."
+            }))
+            await client.close(1013, "Server busy")
+            return
+
+        worker.active += 1
+        self._hold(key)
+        try:
+            upstream = await self._connect(worker)
+            async with upstream:
+                await upstream.send(first_frame)
+                await _relay(client, upstream)
+        except Exception as e:
+            log.info("[Pool] Session on worker %d ended with error: %s", worker.index, e)
+        finally:
+            self._release(key)
+            worker.active -= 1
+            worker.served += 1
+            if self.max_sessions_per_worker and worker.served >= self.max_sessions_per_worker:
+                worker.draining = True
+
+    async def _connect(self, worker):
+        # A freshly spawned worker may still be importing; give it a moment.
+        for attempt in range(CONNECT_RETRIES):
+            try:
+                return await connect(worker.uri)
+            except OSError:
+                if attempt == CONNECT_RETRIES - 1:
+                    raise
+                await asyncio.sleep(0.25)
+
+    async def _open_sessions(self, worker):
+        """Sessions the worker still holds, counting those waiting for a client to resume; None if unknown."""
+        url = f"http://{worker.host}:{worker.port}/sessions"
+        try:
+            fetch = functools.partial(urllib.request.urlopen, url, timeout=2)
+            with await asyncio.get_running_loop().run_in_executor(None, fetch) as response:
+                return json.loads(response.read())["sessions"]
+        except (OSError, ValueError, KeyError) as e:
+            log.info("[Pool] Could not read sessions of worker %d: %s", worker.index, e)
+            return None
+
+    async def _supervise(self):
+        while True:
+            await asyncio.sleep(SUPERVISE_INTERVAL)
+            self._prune_sticky()
+            for worker in self.workers:
+                if not worker.alive():
+                    if worker.active == 0:
+                        log.info("[Pool] Worker %d exited unexpectedly; restarting", worker.index)
+                        await self._restart(worker)
+                # Only an explicit 0 is safe: a worker too busy to answer may hold sessions in their grace period.
+                elif worker.draining and worker.active == 0 and await self._open_sessions(worker) == 0:
+                    log.info("[Pool] Recycling drained worker %d", worker.index)
+                    await self._restart(worker)
+
+    async def _restart(self, worker):
+        await self._stop_process(worker)
+        self._sticky = {key: entry for key, entry in self._sticky.items() if entry[0] != worker.index}
+        worker.start(self._context)
+
+    async def _stop_process(self, worker):
+        if worker.process is None:
+            return
+        if worker.process.is_alive():
+            worker.process.terminate()
+        await asyncio.get_running_loop().run_in_executor(None, worker.process.join, 5)
+
+
+async def _relay(client, upstream):
+    """Copy frames both ways until either side closes."""
+    async def pump(source, sink):
+        async for frame in source:
+            await sink.send(frame)
+
+    tasks = [asyncio.create_task(pump(client, upstream)), asyncio.create_task(pump(upstream, client))]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,75 @@
+"""Incremental delivery of agent replies.
+
+With "stream": True in the llm_config, AG2 hands each completion chunk to the
+default IOStream as it arrives. DeltaStream sits in front of a session's
+stream and turns those chunks into agent_message_delta frames carrying a
+message id and chunk index; everything else passes through untouched.
+"""
+import json
+import threading
+import uuid
+
+
+def stream_chunk(message):
+    """Return the text of an AG2 stream event, or None for any other message."""
+    if getattr(message, "type", None) != "stream" and type(message).__name__ not in ("StreamEvent", "StreamMessage"):
+        return None
+    content = getattr(message, "content", None)
+    content = getattr(content, "content", content)
+    return content if isinstance(content, str) else None
+
+
+class DeltaStream:
+    """IOStream wrapper that frames streamed completion chunks for the client."""
+
+    def __init__(self, target, session):
+        self.target = target
+        self.session = session
+        self.message_id = None
+        self.agent = None
+        self.index = 0
+        self._lock = threading.Lock()
+
+    def _delta(self, text):
+        if not text:
+            return
+        with self._lock:
+            if self.message_id is None:
+                self.message_id = uuid.uuid4().hex
+                self.agent = self.session.current_speaker
+                self.index = 0
+            frame = {
+                "type": "agent_message_delta",
+                "id": self.message_id,
+                "agent": self.agent,
+                "index": self.index,
+                "delta": text
+            }
+            self.index += 1
+        self.target.send(json.dumps(frame))
+
+    def finish(self):
+        """End the message being streamed and return its id, if one was started."""
+        with self._lock:
+            message_id, self.message_id = self.message_id, None
+            return message_id
+
+    def send(self, message):
+        chunk = stream_chunk(message)
+        if chunk is not None:
+            self._delta(chunk)
+        else:
+            self.target.send(message)
+
+    def print(self, *objects, sep=" ", end="\n", flush=False):
+        # Older AG2 releases stream by printing each chunk with end="".
+        if end == "" and flush:
+            self._delta(sep.join(str(o) for o in objects))
+        else:
+            self.target.print(*objects, sep=sep, end=end, flush=flush)
+
+    def input(self, prompt="", *, password=False):
+        return self.target.input(prompt, password=password)
+
+    async def a_input(self):
+        return await self.target.a_input()
@@ -0,0 +1,20 @@
+import pytest
+
+pytest.importorskip("autogen")
+
+import compaction
+from compaction import RollingSummary, message_tokens
+
+
+def test_history_messages_are_tokenized_once(monkeypatch):
+    counted = []
+    monkeypatch.setattr(compaction, "count_token", lambda text, model: counted.append(text) or len(text.split()))
+    transform = RollingSummary(keep_last=3, max_tokens=60)
+    history = []
+    for turn in range(12):
+        history.append({"role": "user", "name": f"Student{turn % 3}", "content": f"Point number {turn} about diffusion."})
+        counted.clear()
+        compacted = transform.apply_transform([dict(m) for m in history])
+        assert [text for text in counted if text.startswith("Point number")] == [history[-1]["content"]]
+        assert transform._last_counts == (message_tokens(history, "gpt-4o"), message_tokens(compacted, "gpt-4o"))
+        assert transform._last_counts[1] <= 60
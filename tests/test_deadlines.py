@@ -0,0 +1,44 @@
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("autogen")
+
+from deadlines import HEDGE_CLIENT, HedgedDeadline  # noqa: E402
+from llm_calls import count_calls, install_middleware  # noqa: E402
+
+
+class FakeClient:
+    def __init__(self, delay, answer):
+        self.delay = delay
+        self.answer = answer
+
+    def create(self, **params):
+        time.sleep(self.delay)
+        return self.answer
+
+
+def test_hedged_duplicate_passes_inner_middlewares():
+    hedger = HedgedDeadline(deadline=5, hedge=True, default_hedge_delay=0.05)
+    hedge_client = FakeClient(0, "hedged")
+    hedger._hedge_client = lambda agent: hedge_client
+    seen = []
+    lock = threading.Lock()
+
+    def record(call_next, agent, params):
+        with lock:
+            seen.append(HEDGE_CLIENT in params)
+        return call_next(params)
+
+    attempts = Counter()
+    agent = SimpleNamespace(name="Teacher", client=FakeClient(0.5, "primary"))
+    install_middleware(agent, hedger, count_calls(attempts), record, hedger.route)
+
+    assert agent.client.create(messages=[]) == "hedged"
+    assert sorted(seen) == [False, True]
+    assert attempts["Teacher"] == 2
+    assert hedger.snapshot()["hedged"] == 1
+    assert hedger.snapshot()["hedge_wins"] == 1
@@ -0,0 +1,31 @@
+import asyncio
+import copy
+import os
+
+import pytest
+
+pytest.importorskip("autogen")
+
+os.environ.setdefault("CONFIG_LIST_PATH", os.path.join(os.path.dirname(__file__), "..", "CONFIG_LIST.mock.json"))
+
+import discussion  # noqa: E402
+from sessions import Session  # noqa: E402
+from ws_stream import ResumableStream  # noqa: E402
+
+
+def test_prompt_size_constant_across_1000_connections():
+    expected = {persona.name: len(persona.system_message) for persona in discussion.persona_store.by_name.values()}
+    student_data = copy.deepcopy(discussion.student_data)
+
+    async def connect(count):
+        sizes = set()
+        for _ in range(count):
+            session = Session(ResumableStream())
+            discussion.build_classroom(session.iostream, session)
+            sizes.add(tuple(len(agent.system_message) for agent in session.agents if agent.name in expected))
+        return sizes
+
+    sizes = asyncio.run(connect(1000))
+    assert sizes == {tuple(expected.values())}
+    assert discussion.persona_store.prompt_chars() == sum(expected.values())
+    assert discussion.student_data == student_data
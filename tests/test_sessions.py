@@ -0,0 +1,25 @@
+import asyncio
+
+from sessions import SessionRegistry
+
+
+def test_cancelled_waiter_does_not_leak_a_handed_off_slot():
+    async def run(steps):
+        registry = SessionRegistry(max_sessions=1, queue_depth=1)
+        first = await registry.admit(object())
+        waiter = asyncio.create_task(registry.admit(object()))
+        await asyncio.sleep(0)
+        assert registry.queued == 1
+
+        # Free the slot at various points while the waiter is unwinding its cancellation,
+        # including after _hand_off has taken its ticket but before _deliver has run.
+        waiter.cancel()
+        for _ in range(steps):
+            await asyncio.sleep(0)
+        registry.close(first.id)
+        await asyncio.gather(waiter, return_exceptions=True)
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return len(registry)
+
+    assert [asyncio.run(run(steps)) for steps in range(5)] == [0] * 5
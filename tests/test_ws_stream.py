@@ -0,0 +1,76 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from streaming import DeltaStream
+from ws_stream import ResumableStream
+
+
+class FakeConnection:
+    def __init__(self):
+        self.sent = []
+        self.inbox = asyncio.Queue()
+        self.closed = False
+
+    def send(self, frame):
+        self.sent.append(frame)
+
+    async def a_input(self):
+        return await self.inbox.get()
+
+    async def aclose(self):
+        self.closed = True
+
+
+def test_frame_seq_is_stream_seq():
+    async def run():
+        stream = ResumableStream()
+        connection = FakeConnection()
+        stream.attach(connection)
+        deltas = DeltaStream(stream, SimpleNamespace(current_speaker="Teacher"))
+        deltas.send(json.dumps({"type": "agent_list", "content": []}))
+        for chunk in ("Good ", "morning"):
+            deltas._delta(chunk)
+        deltas.send(json.dumps({"type": "agent_message", "agent": "Teacher", "content": "Good morning"}))
+        await stream.aclose()
+        return connection.sent
+
+    frames = [json.loads(frame) for frame in asyncio.run(run())]
+    assert [frame["seq"] for frame in frames] == [1, 2, 3, 4]
+    assert [frame["index"] for frame in frames if frame["type"] == "agent_message_delta"] == [0, 1]
+
+
+def test_resume_replays_only_missed_frames():
+    async def run():
+        stream = ResumableStream()
+        first = FakeConnection()
+        stream.attach(first)
+        for n in range(5):
+            stream.send(json.dumps({"type": "system_message", "content": str(n)}))
+        stream.detach(first)
+        stream.send(json.dumps({"type": "system_message", "content": "5"}))
+        second = FakeConnection()
+        stream.attach(second, last_seq=4)
+        await stream.aclose()
+        return second.sent
+
+    assert [json.loads(frame)["seq"] for frame in asyncio.run(run())] == [5, 6]
+
+
+def test_reattach_moves_pending_input_to_the_new_connection():
+    async def run():
+        stream = ResumableStream()
+        stale = FakeConnection()
+        stream.attach(stale)
+        pending = asyncio.create_task(stream.a_input())
+        await asyncio.sleep(0)
+        # The old connection never reports a disconnect, as after a network blip.
+        fresh = FakeConnection()
+        stream.attach(fresh, last_seq=0)
+        fresh.inbox.put_nowait("hello")
+        message = await asyncio.wait_for(pending, 1)
+        await asyncio.sleep(0)
+        await stream.aclose()
+        return message, stale.closed
+
+    assert asyncio.run(run()) == ("hello", True)
@@ -0,0 +1,182 @@
+"""Lightweight per-session tracing.
+
+Each session is one trace. A root "session" span has a "turn" child per
+speaker turn, and each turn has phase spans beneath it: select_speaker,
+message_handler, prompt_assembly (the remaining time before the LLM
+request, spent in history transforms and hooks), llm_call (including rate
+limiting and hedging) and websocket_send. Finished spans go to an
+in-process ring buffer, which /debug/traces reads, and optionally to a
+JSONL file.
+
+LLM calls run on executor threads that do not inherit context variables, so
+parents are passed explicitly, usually the session's current turn span. When
+tracing is disabled, start_span returns a shared no-op span, so instrumented
+code only pays for a function call.
+"""
+import json
+import threading
+import time
+import uuid
+from collections import deque
+
+
+class Span:
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent_id", "start", "end_time", "attributes")
+
+    def __init__(self, tracer, name, trace_id, parent_id, start, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start = start
+        self.end_time = None
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, **attributes):
+        if self.end_time is not None:
+            return
+        self.attributes.update(attributes)
+        self.end_time = time.time()
+        self.tracer._export(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.end()
+        return False
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "end": self.end_time,
+            "duration_ms": round(1000 * (self.end_time - self.start), 3) if self.end_time else None,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    span_id = None
+    trace_id = None
+
+    def set(self, **attributes):
+        pass
+
+    def end(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """Creates spans and keeps the most recent finished ones."""
+
+    def __init__(self, enabled=False, buffer_size=10000, path=None):
+        self.enabled = enabled
+        self.path = path
+        self._buffer = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8") if enabled and path else None
+
+    def start_span(self, name, trace_id=None, parent=None, start=None, **attributes):
+        if not self.enabled:
+            return NOOP_SPAN
+        if parent is not None and parent is not NOOP_SPAN:
+            trace_id = parent.trace_id
+            parent_id = parent.span_id
+        else:
+            parent_id = None
+        return Span(self, name, trace_id or uuid.uuid4().hex, parent_id, start or time.time(), attributes)
+
+    def span(self, name, trace_id=None, parent=None, **attributes):
+        """start_span for use in a with block; the span ends, noting any exception, on exit."""
+        return self.start_span(name, trace_id, parent, **attributes)
+
+    def next_turn(self, session, **attributes):
+        """End the session's current turn span and start the next one."""
+        if session.turn_span:
+            session.turn_span.end()
+        session.turn_span = self.start_span("turn", session.id, parent=session.trace, **attributes)
+        return session.turn_span
+
+    def end_session(self, session, **attributes):
+        if session.turn_span:
+            session.turn_span.end()
+            session.turn_span = None
+        if session.trace:
+            session.trace.end(turns=session.turns, **attributes)
+
+    def _export(self, span):
+        record = span.to_dict()
+        with self._lock:
+            self._buffer.append(record)
+            if self._file:
+                self._file.write(json.dumps(record, default=str) + "\n")
+                self._file.flush()
+
+    def traces(self, trace_id=None, limit=20):
+        """Recent finished spans grouped by trace, newest trace first."""
+        with self._lock:
+            records = list(self._buffer)
+        grouped = {}
+        for record in reversed(records):
+            if trace_id and record["trace_id"] != trace_id:
+                continue
+            if record["trace_id"] not in grouped:
+                if len(grouped) >= limit:
+                    continue
+                grouped[record["trace_id"]] = []
+            grouped[record["trace_id"]].append(record)
+        return [
+            {"trace_id": tid, "spans": sorted(spans, key=lambda r: r["start"])}
+            for tid, spans in grouped.items()
+        ]
+
+    def snapshot(self):
+        with self._lock:
+            buffered = len(self._buffer)
+        return {"enabled": self.enabled, "buffered_spans": buffered, "file": self.path}
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+def llm_span_middleware(tracer, session):
+    """Middleware recording prompt_assembly and llm_call spans under the session's current turn."""
+    def middleware(call_next, agent, params):
+        if not tracer.enabled:
+            return call_next(params)
+        parent = session.turn_span or session.trace
+        if session.phase_mark:
+            tracer.start_span("prompt_assembly", session.id, parent, start=session.phase_mark, agent=agent.name).end()
+        with tracer.span("llm_call", session.id, parent, agent=agent.name) as span:
+            response = call_next(params)
+            usage = getattr(response, "usage", None)
+            span.set(
+                model=getattr(response, "model", None),
+                prompt_tokens=getattr(usage, "prompt_tokens", None),
+                completion_tokens=getattr(usage, "completion_tokens", None),
+            )
+        session.phase_mark = time.time()
+        return response
+    return middleware
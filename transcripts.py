@@ -0,0 +1,278 @@
+"""Append-only SQLite store for discussion transcripts.
+
+Every message an agent sends is appended as one row, with the speaker, the
+routing rule that gave them the turn, the turn's latency and the tokens its
+LLM calls used. Callers only put rows on an in-memory queue. A writer thread
+drains the queue and commits up to BATCH_SIZE rows per transaction, so
+recording a turn never blocks the discussion. When the queue is full, rows
+are dropped and counted rather than waiting.
+
+Messages are indexed by session, by agent and time, and by time, so loading
+one transcript or aggregating over thousands of sessions stays an index
+scan. The database runs in WAL mode, so readers do not wait for the writer,
+and several worker processes can share one file.
+
+An FTS5 index over message text and speaker is kept current by an insert
+trigger, so each turn becomes searchable in the same transaction that stores
+it. TranscriptReader.search() returns ranked snippets with session and turn
+pointers; search_transcripts.py is its command line.
+"""
+import atexit
+import json
+import os
+import queue
+import shlex
+import sqlite3
+import threading
+import time
+
+from log_config import log
+from routing import parse_structured_reply
+
+BATCH_SIZE = 256
+FLUSH_INTERVAL = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    started_at REAL NOT NULL,
+    ended_at REAL,
+    state TEXT,
+    turns INTEGER,
+    meta TEXT
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    turn INTEGER,
+    ts REAL NOT NULL,
+    agent TEXT NOT NULL,
+    role TEXT,
+    content TEXT NOT NULL,
+    routing_rule TEXT,
+    latency_ms REAL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER
+);
+CREATE INDEX IF NOT EXISTS messages_session ON messages(session_id, id);
+CREATE INDEX IF NOT EXISTS messages_agent_ts ON messages(agent, ts, latency_ms, prompt_tokens, completion_tokens);
+CREATE INDEX IF NOT EXISTS messages_ts ON messages(ts);
+CREATE INDEX IF NOT EXISTS sessions_started ON sessions(started_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, agent, content='messages', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, content, agent) VALUES (new.id, new.content, new.agent);
+END;
+"""
+
+MESSAGE_COLUMNS = ("session_id", "turn", "ts", "agent", "role", "content", "routing_rule",
+                   "latency_ms", "prompt_tokens", "completion_tokens")
+
+_INSERT_MESSAGE = f"INSERT INTO messages ({', '.join(MESSAGE_COLUMNS)}) VALUES ({', '.join('?' * len(MESSAGE_COLUMNS))})"
+_OPEN_SESSION = "INSERT OR IGNORE INTO sessions (session_id, started_at, meta) VALUES (?, ?, ?)"
+_CLOSE_SESSION = "UPDATE sessions SET ended_at = ?, state = ?, turns = ? WHERE session_id = ?"
+
+
+def _connect(path):
+    db = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.row_factory = sqlite3.Row
+    return db
+
+
+def _create_schema(path):
+    db = _connect(path)
+    try:
+        had_index = db.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+        db.executescript(SCHEMA)
+        if not had_index:
+            # Stores written before the search index existed: index what is already there.
+            db.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+            db.commit()
+    finally:
+        db.close()
+
+
+def match_query(text):
+    """Turn plain search text into an FTS5 query: every word or "quoted phrase" must appear."""
+    try:
+        terms = shlex.split(text)
+    except ValueError:
+        terms = text.split()
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms if term.strip())
+
+
+class TranscriptReader:
+    """Read queries over a transcript database."""
+
+    def __init__(self, path):
+        self.path = path
+        _create_schema(path)
+
+    def _query(self, sql, params=()):
+        db = _connect(self.path)
+        try:
+            return [dict(row) for row in db.execute(sql, params)]
+        finally:
+            db.close()
+
+    def session_messages(self, session_id):
+        """One transcript in order."""
+        return self._query("SELECT * FROM messages WHERE session_id = ? ORDER BY id", (session_id,))
+
+    def recent_sessions(self, limit=50, agent=None, since=None):
+        """Most recent sessions, optionally only those in which agent spoke, started after since."""
+        where, params = ["started_at >= ?"], [since or 0]
+        if agent:
+            # The unary + keeps SQLite probing each session's own rows instead of every row for agent.
+            where.append("EXISTS (SELECT 1 FROM messages WHERE messages.session_id = sessions.session_id AND +agent = ?)")
+            params.append(agent)
+        return self._query(
+            f"SELECT * FROM sessions WHERE {' AND '.join(where)} ORDER BY started_at DESC LIMIT ?",
+            (*params, limit))
+
+    def agent_stats(self, since=None):
+        """Turns, mean latency and tokens per agent since a timestamp."""
+        return self._query(
+            "SELECT agent, COUNT(*) AS turns, AVG(latency_ms) AS avg_latency_ms, "
+            "SUM(prompt_tokens) AS prompt_tokens, SUM(completion_tokens) AS completion_tokens "
+            "FROM messages WHERE ts >= ? GROUP BY agent ORDER BY turns DESC", (since or 0,))
+
+    def search(self, text, agent=None, session_id=None, limit=20, raw=False):
+        """Best-matching messages with a highlighted snippet and their session and turn.
+
+        text is plain words and "quoted phrases", all of which must appear;
+        with raw=True it is passed to FTS5 as-is (OR, NEAR, prefix*, ...).
+        """
+        query = text if raw else match_query(text)
+        if not query:
+            return []
+        if agent:
+            query = 'agent : "' + agent.replace('"', '""') + f'" AND ({query})'
+        sql = (
+            "SELECT m.id, m.session_id, m.turn, m.ts, m.agent, "
+            "snippet(messages_fts, 0, '[', ']', '...', 16) AS snippet, messages_fts.rank AS score "
+            "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+            "WHERE messages_fts MATCH ?"
+        )
+        params = [query]
+        if session_id:
+            # A rowid range lets FTS5 skip postings outside the session's messages.
+            span = self._query("SELECT MIN(id) AS first, MAX(id) AS last FROM messages WHERE session_id = ?",
+                               (session_id,))[0]
+            if span["first"] is None:
+                return []
+            sql += " AND messages_fts.rowid BETWEEN ? AND ? AND m.session_id = ?"
+            params += [span["first"], span["last"], session_id]
+        sql += " ORDER BY messages_fts.rank LIMIT ?"
+        return self._query(sql, (*params, limit))
+
+
+class TranscriptStore(TranscriptReader):
+    """Queue-fed, batch-committed transcript database with indexed read queries."""
+
+    def __init__(self, path, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, max_pending=100_000):
+        super().__init__(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self._queue = queue.Queue(max_pending)
+        self._writer = threading.Thread(target=self._run, name="transcript-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _put(self, op, params):
+        try:
+            self._queue.put_nowait((op, params))
+        except queue.Full:
+            self.dropped += 1
+
+    def open_session(self, session_id, **meta):
+        self._put(_OPEN_SESSION, (session_id, time.time(), json.dumps(meta) if meta else None))
+
+    def append(self, session_id, agent, content, role=None, turn=None, routing_rule=None,
+               latency_ms=None, prompt_tokens=None, completion_tokens=None, ts=None):
+        """Queue one message; returns immediately."""
+        self._put(_INSERT_MESSAGE, (session_id, turn, ts or time.time(), agent, role, content, routing_rule,
+                                    latency_ms, prompt_tokens, completion_tokens))
+
+    def close_session(self, session_id, state, turns):
+        self._put(_CLOSE_SESSION, (time.time(), state, turns, session_id))
+
+    def _run(self):
+        db = _connect(self.path)
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(op is None for op, _ in batch)
+            try:
+                with db:
+                    for op, params in batch:
+                        if op is not None:
+                            db.execute(op, params)
+                self.written += sum(op == _INSERT_MESSAGE for op, _ in batch)
+                self.batches += 1
+            except sqlite3.Error as e:
+                self.dropped += len(batch)
+                log.warning("Transcript batch of %d rows failed: %s", len(batch), e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                break
+        db.close()
+
+    def flush(self):
+        """Block until everything queued so far is committed."""
+        self._queue.join()
+
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put((None, None))
+            self._writer.join()
+
+    def snapshot(self):
+        return {
+            "path": self.path,
+            "written": self.written,
+            "pending": self._queue.qsize(),
+            "dropped": self.dropped,
+            "batches": self.batches,
+        }
+
+
+def store_from_env():
+    """Open the store at TRANSCRIPT_PATH, or return None when it is unset."""
+    path = os.getenv("TRANSCRIPT_PATH")
+    return TranscriptStore(path) if path else None
+
+
+def attach_transcript(agents, store, session_id, turn_context=None):
+    """Append every message the agents send to store.
+
+    turn_context, if given, is called for each message and returns extra
+    columns for it (routing_rule, latency_ms, tokens, turn).
+    """
+    def record(sender, message, recipient, silent):
+        content = message.get("content", "") if isinstance(message, dict) else message
+        if not isinstance(content, str):
+            content = json.dumps(content, default=str)
+        content, _ = parse_structured_reply(content)
+        role = message.get("role") if isinstance(message, dict) else None
+        store.append(session_id, sender.name, content, role=role, **(turn_context(sender) if turn_context else {}))
+        return message
+
+    for agent in agents:
+        agent.register_hook("process_message_before_send", record)
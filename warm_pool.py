@@ -0,0 +1,95 @@
+"""Pool of classroom sessions prepared ahead of demand.
+
+Each warm session has its agents constructed and the Teacher's opening turn
+already generated, so a client that claims one sees the first message as soon
+as it connects. A background task keeps the pool topped up and closes
+sessions whose opener is older than the TTL.
+"""
+import asyncio
+import time
+
+from log_config import log
+
+
+class WarmSession:
+    """A prepared session waiting for a client."""
+
+    def __init__(self, stream, session, user_proxy, chat_manager, opening_messages):
+        self.stream = stream
+        self.session = session
+        self.user_proxy = user_proxy
+        self.chat_manager = chat_manager
+        self.opening_messages = opening_messages
+        self.created_at = time.time()
+
+    async def aclose(self):
+        """Release a session that will never be claimed."""
+        self.session.state = "expired"
+        await self.stream.aclose()
+
+
+class WarmPool:
+    """Keeps up to `size` WarmSessions built by the `prepare` coroutine."""
+
+    def __init__(self, size, ttl, prepare):
+        self.size = size
+        self.ttl = ttl
+        self.prepare = prepare
+        self.claimed = 0
+        self.expired = 0
+        self._ready = []
+        self._wake = None
+        self._task = None
+        self._closing = set()
+
+    async def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._refill())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        ready, self._ready = self._ready, []
+        for warm in ready:
+            await warm.aclose()
+
+    def claim(self):
+        """Take the oldest unexpired warm session, or None if the pool is empty."""
+        self._drop_expired()
+        if self._wake:
+            self._wake.set()
+        if not self._ready:
+            return None
+        self.claimed += 1
+        return self._ready.pop(0)
+
+    def snapshot(self):
+        return {"size": self.size, "ready": len(self._ready), "claimed": self.claimed, "expired": self.expired}
+
+    def _drop_expired(self):
+        cutoff = time.time() - self.ttl
+        fresh = [warm for warm in self._ready if warm.created_at >= cutoff]
+        for warm in self._ready:
+            if warm.created_at < cutoff:
+                task = asyncio.get_running_loop().create_task(warm.aclose())
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
+        self.expired += len(self._ready) - len(fresh)
+        self._ready = fresh
+
+    async def _refill(self):
+        while True:
+            self._drop_expired()
+            while len(self._ready) < self.size:
+                try:
+                    warm = await self.prepare()
+                except Exception as e:
+                    log.info("[WarmPool] Failed to prepare a session: %s", e)
+                    await asyncio.sleep(5)
+                    continue
+                self._ready.append(warm)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max(self.ttl / 4, 1))
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,258 @@
+"""IOStream adapter over an asyncio WebSocket connection.
+
+Agents send frames synchronously from the event loop or from LLM worker
+threads; a writer task drains them to the socket, so neither side blocks the
+loop. Human input is awaited with a_input(), so a session waiting on a
+student costs one idle coroutine rather than a parked OS thread.
+
+ResumableStream sits between a discussion and its connections, so a client
+that reconnects can pick up where it left off.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+
+import metrics
+
+_CLOSED = object()
+
+
+class WebSocketStream:
+    """Per-connection IOStream for the asyncio discussion driver."""
+
+    def __init__(self, websocket, loop=None):
+        self.websocket = websocket
+        self.loop = loop or asyncio.get_running_loop()
+        self.closed = False
+        self._outbox = asyncio.Queue()
+        self._inbox = asyncio.Queue()
+        self._writer = self.loop.create_task(self._write_frames())
+        self._reader = self.loop.create_task(self._read_frames())
+
+    async def _write_frames(self):
+        while True:
+            frame = await self._outbox.get()
+            if frame is _CLOSED:
+                return
+            try:
+                await self.websocket.send(frame)
+            except Exception:
+                metrics.websocket_send_failures.inc()
+                self.closed = True
+                return
+
+    async def _read_frames(self):
+        try:
+            async for raw in self.websocket:
+                self._inbox.put_nowait(raw)
+        except Exception:
+            pass
+        finally:
+            self.closed = True
+            self._inbox.put_nowait(_CLOSED)
+
+    def _enqueue(self, frame):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self._outbox.put_nowait(frame)
+        else:
+            self.loop.call_soon_threadsafe(self._outbox.put_nowait, frame)
+
+    def send(self, message):
+        """Queue a frame for the client; accepts JSON strings and AG2 events."""
+        if self.closed:
+            metrics.websocket_send_failures.inc()
+            raise ConnectionError("WebSocket connection is closed")
+        if isinstance(message, str):
+            frame = message
+        elif hasattr(message, "model_dump_json"):
+            frame = message.model_dump_json()
+        else:
+            frame = json.dumps(message)
+        self._enqueue(frame)
+
+    def print(self, *objects, sep=" ", end="\n", flush=False):
+        self.send(json.dumps({
+            "type": "print",
+            "content": {"objects": [str(o) for o in objects], "sep": sep, "end": end}
+        }))
+
+    def input(self, prompt="", *, password=False):
+        raise RuntimeError("WebSocketStream only supports asynchronous input; use a_input()")
+
+    async def a_input(self):
+        """Wait for the next frame from the client."""
+        raw = await self._inbox.get()
+        if raw is _CLOSED:
+            self._inbox.put_nowait(_CLOSED)
+            raise ConnectionError("Client disconnected")
+        return raw
+
+    async def aclose(self, code=1000, reason=""):
+        """Flush pending frames, stop the reader and writer tasks and close the connection with code."""
+        self._outbox.put_nowait(_CLOSED)
+        try:
+            await asyncio.wait_for(self._writer, timeout=5)
+        except (asyncio.TimeoutError, Exception):
+            self._writer.cancel()
+        self._reader.cancel()
+        self.closed = True
+        try:
+            await self.websocket.close(code, reason)
+        except Exception:
+            pass
+
+
+class ResumableStream:
+    """IOStream that outlives the connections it is attached to.
+
+    Every frame gets a sequence number ("seq") and is kept in a bounded replay
+    buffer. When the client drops, the stream detaches and keeps buffering.
+    A reconnecting client re-attaches with the last seq it received and is
+    sent only the frames it missed. Waiting for human input survives a
+    disconnect for up to `grace` seconds. A stream can be created before any
+    client connects; its first attach() replays everything sent so far.
+
+    Attaching a new connection closes the one it replaces, which may still
+    look open after a network blip, and moves a pending a_input() over to the
+    new connection.
+    """
+
+    def __init__(self, grace=120.0, buffer_frames=5000, loop=None):
+        self.grace = grace
+        self.loop = loop or asyncio.get_running_loop()
+        self.target = None
+        self.seq = 0
+        self.detached_at = time.monotonic()
+        self.finished = False
+        self._buffer = deque(maxlen=buffer_frames)
+        self._lock = threading.Lock()
+        self._attached = asyncio.Event()
+        self._released = None
+        self._closing = set()
+
+    def _call_on_loop(self, fn, *args):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            fn(*args)
+        else:
+            self.loop.call_soon_threadsafe(fn, *args)
+
+    def attach(self, target, last_seq=0):
+        """Forward to target after replaying frames newer than last_seq; returns a future that
+        resolves when target is detached or the stream finishes."""
+        with self._lock:
+            previous = self.target
+            self._release()
+            self.target = target
+            self._released = self.loop.create_future()
+            if self._buffer and self._buffer[0][0] > last_seq + 1:
+                target.send(json.dumps({
+                    "type": "system_message",
+                    "content": "Some earlier messages could not be replayed after reconnecting."
+                }))
+            for seq, frame in self._buffer:
+                if seq > last_seq:
+                    target.send(frame)
+        self._call_on_loop(self._attached.set)
+        if previous is not None and previous is not target:
+            self._call_on_loop(self._close_replaced, previous)
+        return self._released
+
+    def _close_replaced(self, target):
+        task = self.loop.create_task(target.aclose())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    def _release(self):
+        if self._released is not None:
+            self._call_on_loop(lambda f: f.done() or f.set_result(None), self._released)
+            self._released = None
+
+    def detach(self, target=None):
+        """Stop forwarding (only if target is still the attached connection)."""
+        with self._lock:
+            if self.target is None or (target is not None and self.target is not target):
+                return
+            self.target = None
+            self.detached_at = time.monotonic()
+            self._release()
+        self._call_on_loop(self._attached.clear)
+
+    def send(self, message):
+        if isinstance(message, str):
+            frame = message
+        elif hasattr(message, "model_dump_json"):
+            frame = message.model_dump_json()
+        else:
+            frame = json.dumps(message)
+        with self._lock:
+            self.seq += 1
+            if frame.startswith("{") and frame.rstrip() != "{}":
+                frame = f'{{"seq": {self.seq}, ' + frame[1:]
+            else:
+                frame = json.dumps({"seq": self.seq, "type": "raw", "content": frame})
+            self._buffer.append((self.seq, frame))
+            target = self.target
+        if target is None:
+            return
+        try:
+            target.send(frame)
+        except ConnectionError:
+            self.detach(target)
+
+    def print(self, *objects, sep=" ", end="\n", flush=False):
+        self.send(json.dumps({
+            "type": "print",
+            "content": {"objects": [str(o) for o in objects], "sep": sep, "end": end}
+        }))
+
+    def input(self, prompt="", *, password=False):
+        raise RuntimeError("ResumableStream only supports asynchronous input; use a_input()")
+
+    async def a_input(self):
+        """Next frame from the attached client, waiting out disconnects shorter than the grace period."""
+        while True:
+            with self._lock:
+                target, released = self.target, self._released
+            if target is None:
+                remaining = self.grace - (time.monotonic() - self.detached_at)
+                if self.finished or remaining <= 0:
+                    raise ConnectionError("Client disconnected")
+                try:
+                    await asyncio.wait_for(self._attached.wait(), remaining)
+                except asyncio.TimeoutError:
+                    raise ConnectionError("Client did not reconnect in time") from None
+                continue
+            read = asyncio.ensure_future(target.a_input())
+            try:
+                done, _ = await asyncio.wait((read, released), return_when=asyncio.FIRST_COMPLETED)
+            except asyncio.CancelledError:
+                read.cancel()
+                raise
+            if read not in done:
+                # target was replaced or detached; read from whichever connection comes next.
+                read.cancel()
+                continue
+            try:
+                return read.result()
+            except ConnectionError:
+                self.detach(target)
+
+    async def aclose(self):
+        """Finish the stream and close the attached connection, if any."""
+        self.finished = True
+        with self._lock:
+            target = self.target
+            self.target = None
+            self._release()
+        if target is not None:
+            await target.aclose()